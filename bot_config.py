@@ -5,6 +5,8 @@ DEV_ID = int(os.getenv('DEV_ID', '175386962364989440'))
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 MONGO_URL = os.getenv('DISCORD_MONGO_URL')
 MONGO_DB = os.getenv('MONGO_DB', 'frogbotdb')
+# Seconds between Mongo command summaries in the log. 0 disables them.
+MONGO_STATS_LOG_SECONDS = float(os.getenv('MONGO_STATS_LOG_SECONDS', '3600'))
 DEFAULT_STATUS = os.getenv('DISCORD_STATUS', f'with the API')
 
 # API
@@ -13,9 +15,95 @@ API_KEY = os.getenv('BOT_API_KEY', None)
 DBL_API_KEY = os.getenv('BOT_DBL_API_KEY', None)
 DAGPI_API_KEY = os.getenv('BOT_DAGPI_API_KEY', None)
 
+# Rate Limits
+RATELIMIT_POLICIES = os.getenv('RATELIMIT_POLICIES', 'images=1/30,dm=1/3')
+RATELIMIT_MAX_BUCKETS = int(os.getenv('RATELIMIT_MAX_BUCKETS', '10000'))
+# Seconds between rate limit snapshots to the DB. 0 disables snapshotting.
+RATELIMIT_SNAPSHOT_SECONDS = float(os.getenv('RATELIMIT_SNAPSHOT_SECONDS', '60'))
+
+# Health Checks (disabled unless a port is set)
+HEALTH_PORT = int(os.getenv('HEALTH_PORT', '0'))
+# Local only by default, set to 0.0.0.0 to expose the endpoints outside the host or container.
+HEALTH_HOST = os.getenv('HEALTH_HOST', '127.0.0.1')
+
+# Shared HTTP client
+HTTP_LIMIT = int(os.getenv('HTTP_LIMIT', '100'))
+HTTP_LIMIT_PER_HOST = int(os.getenv('HTTP_LIMIT_PER_HOST', '10'))
+HTTP_DNS_TTL = int(os.getenv('HTTP_DNS_TTL', '300'))
+HTTP_KEEPALIVE = float(os.getenv('HTTP_KEEPALIVE', '30'))
+
+# Event Loop Monitoring
+LOOP_MONITOR_INTERVAL = float(os.getenv('LOOP_MONITOR_INTERVAL', '0.5'))
+# Log the stack of anything blocking the loop for longer than SLOW_CALLBACK_MS.
+LOOP_DEBUG = os.getenv('LOOP_DEBUG', 'false').lower() in ('true', '1', 'yes')
+SLOW_CALLBACK_MS = float(os.getenv('SLOW_CALLBACK_MS', '250'))
+
+# Gateway Stats
+GATEWAY_STATS_INTERVAL = float(os.getenv('GATEWAY_STATS_INTERVAL', '10'))
+GATEWAY_STATS_HISTORY = int(os.getenv('GATEWAY_STATS_HISTORY', '60'))
+GATEWAY_GUILD_STATS = os.getenv('GATEWAY_GUILD_STATS', 'false').lower() in ('true', '1', 'yes')
+
+# System Metrics
+SYSTEM_SAMPLE_INTERVAL = float(os.getenv('SYSTEM_SAMPLE_INTERVAL', '30'))
+SYSTEM_SAMPLE_HISTORY = int(os.getenv('SYSTEM_SAMPLE_HISTORY', '120'))
+
+# Profiling
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+
+# Messages received before ready are held and dispatched once it is, unless older than the max age
+READY_BUFFER_SIZE = int(os.getenv('READY_BUFFER_SIZE', '200'))
+READY_BUFFER_MAX_AGE = float(os.getenv('READY_BUFFER_MAX_AGE', '60'))
+
+# Lean mode disables the presence intent: less gateway traffic and member cache memory, but member status is
+# unknown. Measure the difference with `python -m utils.presence_benchmark`.
+LEAN_MODE = os.getenv('LEAN_MODE', 'false').lower() in ('true', '1', 'yes')
+
+# Members are looked up on demand instead of chunked at startup, and cached with LRU eviction
+MEMBER_CACHE_SIZE = int(os.getenv('MEMBER_CACHE_SIZE', '5000'))
+MEMBER_CACHE_TTL = float(os.getenv('MEMBER_CACHE_TTL', '600'))
+MEMBER_ABSENT_TTL = float(os.getenv('MEMBER_ABSENT_TTL', '60'))
+
+# Extensions loaded on first use instead of at startup, see utils/lazy_cogs.py
+LAZY_COGS = os.getenv('LAZY_COGS', 'jishaku,cogs.images,cogs.quest_roles')
+
 # Version
 VERSION = os.getenv('VERSION', 'testing')
 
+# Logging
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# Per-logger levels, e.g. `discord.gateway=WARNING,sheet approval=DEBUG`
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'discord.gateway=WARNING,discord.client=WARNING')
+LOG_JSON = os.getenv('LOG_JSON', 'false').lower() in ('true', '1', 'yes')
+
 # Error Reporting
 SENTRY_URL = os.getenv('SENTRY_URL', None)
 ENVIRONMENT = os.getenv('ENV', 'development')
+# Trace sample rate per command, with `default` for everything else.
+SENTRY_TRACE_RATES = os.getenv('SENTRY_TRACE_RATES', 'default=0.05')
+# Send at most SENTRY_ERROR_LIMIT of the same error every SENTRY_ERROR_WINDOW seconds.
+SENTRY_ERROR_LIMIT = int(os.getenv('SENTRY_ERROR_LIMIT', '5'))
+SENTRY_ERROR_WINDOW = float(os.getenv('SENTRY_ERROR_WINDOW', '3600'))
+
+# Sheet Approval
+SHEET_CLEANUP_HOURS = float(os.getenv('SHEET_CLEANUP_HOURS', '24'))
+SHEET_CLEANUP_BATCH_SIZE = int(os.getenv('SHEET_CLEANUP_BATCH_SIZE', '500'))
+SHEET_CLEANUP_CONCURRENCY = int(os.getenv('SHEET_CLEANUP_CONCURRENCY', '5'))
+SHEET_EXPIRE_DAYS = float(os.getenv('SHEET_EXPIRE_DAYS', '60'))
+# Batch approval announcements within this many seconds into one message. 0 sends each one immediately.
+APPROVAL_DIGEST_SECONDS = float(os.getenv('APPROVAL_DIGEST_SECONDS', '0'))
+SHEET_QUEUE_CACHE_SECONDS = float(os.getenv('SHEET_QUEUE_CACHE_SECONDS', '60'))
+
+# Images
+IMAGE_REMOTE_FALLBACK = os.getenv('IMAGE_REMOTE_FALLBACK', 'true').lower() in ('true', '1', 'yes')
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', '2'))
+IMAGE_QUEUE_SIZE = int(os.getenv('IMAGE_QUEUE_SIZE', '20'))
+IMAGE_QUEUE_PER_USER = int(os.getenv('IMAGE_QUEUE_PER_USER', '2'))
+IMAGE_CACHE_MB = float(os.getenv('IMAGE_CACHE_MB', '64'))
+IMAGE_CACHE_DIR = os.getenv('IMAGE_CACHE_DIR', None)
+IMAGE_CACHE_DISK_MB = float(os.getenv('IMAGE_CACHE_DISK_MB', '512'))
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(8 * 1000 * 1000)))
+# Decoded size limit for a single image or frame, checked before decoding
+IMAGE_MAX_PIXELS = int(os.getenv('IMAGE_MAX_PIXELS', '25000000'))
+IMAGE_MAX_FRAMES = int(os.getenv('IMAGE_MAX_FRAMES', '150'))
+IMAGE_MAX_ANIMATION_PIXELS = int(os.getenv('IMAGE_MAX_ANIMATION_PIXELS', '40000000'))
@@ -4,7 +4,7 @@ import discord
 from discord.ext import commands
 import typing
 
-from utils.checks import is_owner, can_use_dm
+from utils.checks import is_owner, can_use_dm, rate_limited
 from utils.functions import create_default_embed
 from .models.dm_objects import DMCategory, CategoryExists, DMPermissions, DMChannel
 
@@ -24,7 +24,7 @@ class DMCommands(commands.Cog):
 
     @commands.group(name='dm', invoke_without_command=True)
     @can_use_dm()
-    @commands.cooldown(1, 3, commands.BucketType.user)
+    @rate_limited('dm')
     async def dm(self, ctx):
         """
         Base command for all other DM commands
@@ -1,13 +1,28 @@
-import collections
+import asyncio
+import logging
 import re
 
 import aiohttp
 import discord
 from discord.ext import commands
-from utils.errors import APIError
+
+import bot_config as config
+from utils.checks import is_owner
+from utils.errors import APIError, QueueFull
+from utils.functions import create_default_embed
+from utils.image_cache import ImageCache, content_key
+from utils.image_jobs import ImageJobQueue
 import io
 
-FakeCoolDown = collections.namedtuple('FakeCoolDown', ['rate', 'per', 'type'])
+try:
+    from utils import image_filters
+except ImportError:
+    image_filters = None
+
+log = logging.getLogger(__name__)
+
+# Filters some-random-api can run for us if the local engine is unavailable.
+REMOTE_FILTERS = ('invert', 'wasted', 'greyscale', 'blur')
 
 
 def remove_queries_from_url(url: str) -> str:
@@ -30,84 +45,228 @@ def url_from_context(ctx, url: str = None) -> str:
 
 class Images(commands.Cog):
     """
-    Commands made using various image API's
+    Commands for applying filters to images
     """
 
     def __init__(self, bot):
 
         self.bot = bot
-        self.session = aiohttp.ClientSession()
-        self._cd = commands.CooldownMapping.from_cooldown(1, 30, commands.BucketType.user)
+        if image_filters is None:
+            log.warning('Pillow/NumPy not installed, image filters will use some-random-api.')
+            self.jobs = None
+        else:
+            self.jobs = ImageJobQueue(bot.loop, workers=config.IMAGE_WORKERS, max_queued=config.IMAGE_QUEUE_SIZE,
+                                      max_per_user=config.IMAGE_QUEUE_PER_USER)
+        self.cache = ImageCache(max_bytes=config.IMAGE_CACHE_MB * 1024 * 1024, disk_dir=config.IMAGE_CACHE_DIR,
+                                max_disk_bytes=config.IMAGE_CACHE_DISK_MB * 1024 * 1024)
+        self._in_flight = {}
+        self.coalesced = 0
         self.url_regex = re.compile(r'(http(s?):)([/|.|\w|\s|-])*\.(?:jpg|jpeg|gif|png)')
 
-    async def cog_check(self, ctx):
-        bucket = self._cd.get_bucket(ctx.message)
-        retry_after = bucket.update_rate_limit()
+    def cog_unload(self):
+        if self.jobs is not None:
+            self.jobs.close()
+
+    async def cog_before_invoke(self, ctx):
+        # Not a check, so help doesn't use up the rate limit.
+        if ctx.author.id == self.bot.owner:
+            return
+        retry_after = self.bot.ratelimits.update('images', ctx.author.id)
         if retry_after:
-            if ctx.author.id == self.bot.owner:
-                return True
-            cooldown = FakeCoolDown(1, 30, commands.BucketType.user)
-            raise commands.CommandOnCooldown(cooldown, bucket.get_retry_after())
-        return True
-
-    async def image_response(self, url) -> discord.File:
-        """
-        Takes a URL, makes a GET request and returns a file if one is returned, otherwise raises an error.
-        """
-        async with self.session.get(url=url) as r:
-            if r.status != 200:
-                try:
-                    error_json = await r.json()
-                    error = error_json['error']
-                except (aiohttp.ClientResponseError, KeyError):
-                    error = 'The API raised an unknown error.'
-                raise APIError(error)
-            try:
-                image_bytes_raw = await r.read()
-                image_bytes = io.BytesIO(image_bytes_raw)
-            except aiohttp.ClientResponseError:
-                raise APIError('The API raised an unknown error.')
-            return discord.File(image_bytes, filename='inverted.png')
+            raise commands.CommandOnCooldown(self.bot.ratelimits.policies['images'], retry_after)
+
+    async def download(self, url) -> bytes:
+        """
+        Makes a GET request to a URL and returns the body if it is an image, otherwise raises an error.
 
-    async def api_image_filter(self, filter_name: str, url: str) -> discord.File:
+        The body is streamed and rejected as soon as it is known to be larger than `IMAGE_MAX_BYTES`.
+        Chunks are joined once into a `bytes` object, which `io.BytesIO` can wrap without copying it again.
+        """
+        try:
+            async with self.bot.session.get(url=url) as r:
+                if r.status != 200:
+                    try:
+                        error_json = await r.json()
+                        error = error_json['error']
+                    except (aiohttp.ClientResponseError, aiohttp.ContentTypeError, KeyError):
+                        error = 'The API raised an unknown error.'
+                    raise APIError(error)
+                if not r.content_type.startswith('image/'):
+                    raise APIError('That URL is not an image.')
+                if r.content_length is not None and r.content_length > config.IMAGE_MAX_BYTES:
+                    raise APIError(f'That image is too large (max {config.IMAGE_MAX_BYTES // 1000000} MB).')
+
+                chunks = []
+                size = 0
+                async for chunk in r.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > config.IMAGE_MAX_BYTES:
+                        raise APIError(f'That image is too large (max {config.IMAGE_MAX_BYTES // 1000000} MB).')
+                    chunks.append(chunk)
+                return b''.join(chunks)
+        except (asyncio.TimeoutError, aiohttp.ClientError):
+            # Unreachable hosts, bad URLs, timeouts and connections dropped mid-download.
+            raise APIError('I could not download that image.')
+
+    async def api_image_filter(self, filter_name: str, url: str) -> bytes:
         """
         Takes a filter and a url to parse into some-random-api
         """
         base_url = f'https://some-random-api.ml/canvas/{filter_name}?avatar={url}'
-        return await self.image_response(base_url)
+        return await self.download(base_url)
+
+    async def local_image_filter(self, filter_name: str, url: str) -> bytes:
+        """
+        Downloads the image at `url` and applies the filter in the image process pool.
+
+        Results are cached by the content of the source, so the same image under another URL is not re-rendered.
+        """
+        source = await self.download(url)
+        key = content_key(filter_name, source)
+        result = await self.cache.get(key)
+        if result is None:
+            try:
+                result = await self.jobs.submit(image_filters.apply_filter, filter_name, source,
+                                                config.IMAGE_MAX_FRAMES, config.IMAGE_MAX_ANIMATION_PIXELS,
+                                                config.IMAGE_MAX_PIXELS)
+            except (OSError, ValueError, image_filters.Image.DecompressionBombError):
+                raise APIError('That URL is not an image I can read, or it is too large.')
+            await self.cache.put(key, result)
+        self.cache.alias(filter_name, url, key)
+        return result
+
+    async def image_filter(self, filter_name: str, url: str, user_id: int) -> bytes:
+        """
+        Applies a filter to the image at `url`.
+
+        Identical requests that arrive while one is already running wait for it and share its result. Only the
+        request that started the work counts against its user's share of the image queue.
+        """
+        key = (filter_name, url)
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            if self.jobs is not None:
+                self.jobs.reserve(user_id)
+            task = self.bot.loop.create_task(self.render_image(filter_name, url))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._finish_render(key, user_id))
+        return await asyncio.shield(task)
+
+    def _finish_render(self, key, user_id: int):
+        self._in_flight.pop(key, None)
+        if self.jobs is not None:
+            self.jobs.release(user_id)
+
+    async def render_image(self, filter_name: str, url: str) -> bytes:
+        """
+        Applies a filter locally, falling back to some-random-api if the local engine is missing or fails.
+        """
+        cached = await self.cache.get(self.cache.resolve(filter_name, url))
+        if cached is not None:
+            return cached
+
+        if self.jobs is not None:
+            try:
+                return await self.local_image_filter(filter_name, url)
+            except APIError:
+                if not (config.IMAGE_REMOTE_FALLBACK and filter_name in REMOTE_FILTERS):
+                    raise
+                log.info(f'Local {filter_name} filter failed, falling back to some-random-api.')
+        elif filter_name not in REMOTE_FILTERS:
+            raise APIError('This filter is not available right now.')
+
+        result = await self.api_image_filter(filter_name, url)
+        key = f'{filter_name}:url:{url}'
+        await self.cache.put(key, result)
+        self.cache.alias(filter_name, url, key)
+        return result
+
+    async def send_filtered(self, ctx, filter_name: str, url: str):
+        async with ctx.channel.typing():
+            url = remove_queries_from_url(url)
+            is_valid_url = self.url_regex.findall(url)
+            if not is_valid_url:
+                return await ctx.send('That is not a valid image URL.')
+            try:
+                result = await self.image_filter(filter_name=filter_name, url=url, user_id=ctx.author.id)
+            except (APIError, QueueFull) as error:
+                return await ctx.send(f'Error: {str(error)}')
+            extension = 'gif' if result[:4] == b'GIF8' else 'png'
+            await ctx.send(file=discord.File(io.BytesIO(result), filename=f'{filter_name}.{extension}'))
+
+    @commands.command(name='imagestats', hidden=True)
+    @is_owner()
+    async def image_stats(self, ctx):
+        """
+        Shows the state of the image processing queue.
+        """
+        embed = create_default_embed(ctx)
+        embed.title = 'Image Queue'
+        cache = self.cache.stats()
+        embed.add_field(name='Cache', value=f'{cache["entries"]} entries '
+                                            f'({cache["memory_bytes"] / 1000000:.2f} MB)\n'
+                                            f'{cache["disk_entries"]} on disk '
+                                            f'({cache["disk_bytes"] / 1000000:.2f} MB)\n'
+                                            f'{cache["hits"]} hits, {cache["disk_hits"]} disk hits, '
+                                            f'{cache["misses"]} misses\n'
+                                            f'{self.coalesced} coalesced requests', inline=False)
+        if self.jobs is None:
+            embed.description = 'Local image processing is disabled.'
+            return await ctx.send(embed=embed)
+        metrics = self.jobs.metrics()
+        embed.add_field(name='Queue Depth', value=f'{metrics["depth"]} (max {metrics["max_depth"]})')
+        embed.add_field(name='Jobs', value=f'{metrics["completed"]} completed\n'
+                                           f'{metrics["failed"]} failed\n'
+                                           f'{metrics["rejected"]} rejected\n'
+                                           f'{metrics["restarts"]} pool restarts')
+        embed.add_field(name='Timing', value=f'Avg wait: {metrics["avg_wait"] * 1000:.0f} ms\n'
+                                             f'Avg job: {metrics["avg_job_time"] * 1000:.0f} ms\n'
+                                             f'Max job: {metrics["max_job_time"] * 1000:.0f} ms')
+        await ctx.send(embed=embed)
 
     @commands.command(name='invert')
     async def invert_image(self, ctx, *, url: str):
         """
         Inverts the colors for a given URL.
         """
-        url = remove_queries_from_url(url)
-        is_valid_url = self.url_regex.findall(url)
-        if not is_valid_url:
-            return await ctx.send('That is not a valid image URL.')
-        try:
-            to_send = await self.api_image_filter(filter_name='invert', url=url)
-        except APIError as error:
-            return await ctx.send(f'Error: {str(error)}')
-        await ctx.send(file=to_send)
+        await self.send_filtered(ctx, 'invert', url)
 
     @commands.command(name='wasted')
     async def wasted_overlay(self, ctx, *, url: str):
         """
         Overlays the image with "wasted" from GTA.
         """
-        with ctx.channel.typing():
-            url = remove_queries_from_url(url)
-            is_valid_url = self.url_regex.findall(url)
-            if not is_valid_url:
-                await ctx.send('That is not a valid image URL.')
-                return
-            try:
-                to_send = await self.api_image_filter(filter_name='wasted', url=url)
-            except APIError as error:
-                await ctx.send(f'Error: {str(error)}')
-                return
-            await ctx.send(file=to_send)
+        await self.send_filtered(ctx, 'wasted', url)
+
+    @commands.command(name='greyscale', aliases=['grayscale'])
+    async def greyscale_image(self, ctx, *, url: str):
+        """
+        Converts the image at a given URL to greyscale.
+        """
+        await self.send_filtered(ctx, 'greyscale', url)
+
+    @commands.command(name='blur')
+    async def blur_image(self, ctx, *, url: str):
+        """
+        Blurs the image at a given URL.
+        """
+        await self.send_filtered(ctx, 'blur', url)
+
+    @commands.command(name='sepia')
+    async def sepia_image(self, ctx, *, url: str):
+        """
+        Applies a sepia tone to the image at a given URL.
+        """
+        await self.send_filtered(ctx, 'sepia', url)
+
+    @commands.command(name='pixelate')
+    async def pixelate_image(self, ctx, *, url: str):
+        """
+        Pixelates the image at a given URL.
+        """
+        await self.send_filtered(ctx, 'pixelate', url)
 
 
 def setup(bot):
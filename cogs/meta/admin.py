@@ -1,7 +1,23 @@
+import asyncio
+import collections
+import os
+import threading
+import tracemalloc
+from datetime import datetime
+
 from discord.ext import commands
 from utils.checks import is_owner
 import discord
+
+import bot_config as config
 from utils.functions import create_default_embed
+from utils import memory_profile
+from utils.profiler import CProfileSession, SamplingProfiler
+
+# How many named tracemalloc snapshots to keep before dropping the oldest.
+MAX_SNAPSHOTS = 5
+# Longest a profiling session may run, in seconds.
+MAX_PROFILE_SECONDS = 300
 
 
 def channel_id_to_link(channel_id):
@@ -13,6 +29,15 @@ def channel_id_to_link(channel_id):
 class Admin(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.snapshots = collections.OrderedDict()
+        self.profiler = None
+        self._profile_task = None
+
+    def cog_unload(self):
+        if self._profile_task is not None:
+            self._profile_task.cancel()
+        if self.profiler is not None:
+            self.profiler.stop()
 
     # ---- Bot Owner Commands ----
     @commands.group(name='admin', invoke_without_command=True)
@@ -119,6 +144,206 @@ class Admin(commands.Cog):
 
         return await ctx.send(f'Set <#{channel.id}> to sheet channel.')
 
+    @admin.command(name='mongo')
+    @is_owner()
+    async def mongo_stats(self, ctx, sort_by: str = 'total'):
+        """
+        Shows Mongo command latency per collection and command.
+
+        Sort by `total` time (default), `count`, `errors`, `avg`, `p50`, `p95` or `p99`.
+        """
+        if sort_by not in ('total', 'count', 'errors', 'avg', 'p50', 'p95', 'p99'):
+            return await ctx.send('Invalid sort, use one of total, count, errors, avg, p50, p95 or p99.')
+        metrics = self.bot.mongo_metrics
+        embed = create_default_embed(ctx)
+        embed.title = 'FrogBot Mongo Stats'
+        rows = metrics.summary(sort_by)[:10]
+        embed.description = '\n'.join(
+            f'`{collection}.{command}` - {stats["count"]} calls, {stats["errors"]} err, '
+            f'avg {stats["avg"]:.1f} / p50 {stats["p50"]:.1f} / p99 {stats["p99"]:.1f} ms'
+            for (collection, command), stats in rows
+        ) or 'No commands recorded yet.'
+        checkout = metrics.checkout_summary()
+        embed.add_field(name='Pool Checkout Wait', value=f'{checkout["count"]} checkouts\n'
+                                                         f'p50 {checkout["p50"]:.2f} ms, '
+                                                         f'p99 {checkout["p99"]:.2f} ms\n'
+                                                         f'{checkout["failures"]} failures')
+        await ctx.send(embed=embed)
+
+    @admin.group(name='memory', aliases=['mem'], invoke_without_command=True)
+    @is_owner()
+    async def memory(self, ctx):
+        """
+        Memory profiling with tracemalloc. Shows the current tracing status.
+        """
+        embed = create_default_embed(ctx)
+        embed.title = 'FrogBot Memory Profiling'
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            embed.description = f'Tracing ({tracemalloc.get_traceback_limit()} frames).\n' \
+                                f'Traced: {memory_profile.format_size(current)}, ' \
+                                f'peak {memory_profile.format_size(peak)}\n' \
+                                f'Overhead: {memory_profile.format_size(tracemalloc.get_tracemalloc_memory())}'
+        else:
+            embed.description = 'Not tracing.'
+        embed.add_field(name='Snapshots', value=', '.join(f'`{name}`' for name in self.snapshots) or 'None')
+        await ctx.send(embed=embed)
+
+    @memory.command(name='start')
+    @is_owner()
+    async def memory_start(self, ctx, frames: int = 10):
+        """
+        Starts tracing allocations, storing up to `frames` frames per allocation.
+        """
+        if tracemalloc.is_tracing():
+            return await ctx.send('Already tracing.')
+        tracemalloc.start(frames)
+        await ctx.send(f'Started tracing with {frames} frames.')
+
+    @memory.command(name='stop')
+    @is_owner()
+    async def memory_stop(self, ctx):
+        """
+        Stops tracing allocations and clears all snapshots.
+        """
+        tracemalloc.stop()
+        self.snapshots.clear()
+        await ctx.send('Stopped tracing.')
+
+    @memory.command(name='snapshot', aliases=['snap'])
+    @is_owner()
+    async def memory_snapshot(self, ctx, name: str):
+        """
+        Takes a named snapshot of traced allocations.
+        """
+        if not tracemalloc.is_tracing():
+            return await ctx.send('Not tracing, start tracing first.')
+        snapshot = await self.bot.loop.run_in_executor(None, memory_profile.take_snapshot)
+        self.snapshots.pop(name, None)
+        self.snapshots[name] = snapshot
+        while len(self.snapshots) > MAX_SNAPSHOTS:
+            self.snapshots.popitem(last=False)
+        await ctx.send(f'Snapshot `{name}` taken ({len(snapshot.traces)} traces).')
+
+    @memory.command(name='top')
+    @is_owner()
+    async def memory_top(self, ctx, name: str = None, group: str = 'line'):
+        """
+        Shows the top allocation sites in a snapshot, or a fresh one if no name is given.
+
+        Pass `module` as the group to total allocations per FrogBot module instead of per line.
+        """
+        if name is None or name not in self.snapshots:
+            if not tracemalloc.is_tracing():
+                return await ctx.send('Not tracing, start tracing first.')
+            if name is not None:
+                return await ctx.send(f'No snapshot named `{name}`.')
+            snapshot = await self.bot.loop.run_in_executor(None, memory_profile.take_snapshot)
+        else:
+            snapshot = self.snapshots[name]
+        lines = await self.bot.loop.run_in_executor(None, memory_profile.top_lines, snapshot, 10,
+                                                    group == 'module')
+        embed = create_default_embed(ctx)
+        embed.title = f'Top Allocations - {name or "now"}'
+        embed.description = '\n'.join(f'`{line}`' for line in lines) or 'Nothing traced.'
+        await ctx.send(embed=embed)
+
+    @memory.command(name='diff')
+    @is_owner()
+    async def memory_diff(self, ctx, old: str, new: str, group: str = 'line'):
+        """
+        Shows what grew the most between two snapshots.
+
+        Pass `module` as the group to total allocations per FrogBot module instead of per line.
+        """
+        if old not in self.snapshots or new not in self.snapshots:
+            return await ctx.send('Both snapshots must exist.')
+        lines = await self.bot.loop.run_in_executor(None, memory_profile.diff_lines, self.snapshots[old],
+                                                    self.snapshots[new], 10, group == 'module')
+        embed = create_default_embed(ctx)
+        embed.title = f'Allocation Diff - {old} → {new}'
+        embed.description = '\n'.join(f'`{line}`' for line in lines) or 'No differences.'
+        await ctx.send(embed=embed)
+
+    @admin.group(name='profile', invoke_without_command=True)
+    @is_owner()
+    async def profile(self, ctx):
+        """
+        CPU profiling of the live bot. Shows whether a session is running.
+        """
+        if self.profiler is None:
+            return await ctx.send(f'No profiling session running. Start one with `{ctx.prefix}admin profile start`.')
+        await ctx.send(f'A {"sampling" if isinstance(self.profiler, SamplingProfiler) else "cProfile"} '
+                       f'session is running.')
+
+    @profile.command(name='start')
+    @is_owner()
+    async def profile_start(self, ctx, seconds: int = 30, mode: str = 'sample'):
+        """
+        Profiles the bot for up to `seconds` seconds, then posts the results here.
+
+        `mode` is `sample` (default, low overhead stack sampling) or `cprofile` (exact, but slower).
+        """
+        if self.profiler is not None:
+            return await ctx.send('A profiling session is already running.')
+        if mode not in ('sample', 'cprofile'):
+            return await ctx.send('Mode must be `sample` or `cprofile`.')
+        seconds = max(1, min(seconds, MAX_PROFILE_SECONDS))
+        if mode == 'sample':
+            self.profiler = SamplingProfiler(threading.get_ident(), interval=config.PROFILE_SAMPLE_INTERVAL)
+        else:
+            self.profiler = CProfileSession()
+        self.profiler.start()
+        self._profile_task = self.bot.loop.create_task(self._profile_timeout(ctx, seconds))
+        await ctx.send(f'Profiling for {seconds} seconds ({mode}).')
+
+    @profile.command(name='stop')
+    @is_owner()
+    async def profile_stop(self, ctx, scope: str = 'all'):
+        """
+        Stops the running profiling session early and posts the results.
+
+        Pass `frogbot` as the scope to only show FrogBot's own functions.
+        """
+        if self.profiler is None:
+            return await ctx.send('No profiling session running.')
+        self._profile_task.cancel()
+        await self._finish_profile(ctx, project_only=scope.lower() == 'frogbot')
+
+    async def _profile_timeout(self, ctx, seconds):
+        await asyncio.sleep(seconds)
+        await self._finish_profile(ctx, project_only=False)
+
+    async def _finish_profile(self, ctx, project_only: bool):
+        profiler, self.profiler, self._profile_task = self.profiler, None, None
+        profiler.stop()
+
+        os.makedirs(config.PROFILE_DIR, exist_ok=True)
+        sampling = isinstance(profiler, SamplingProfiler)
+        path = os.path.join(config.PROFILE_DIR, f'{datetime.utcnow():%Y%m%d-%H%M%S}'
+                                                f'{".collapsed" if sampling else ".pstats"}')
+        await self.bot.loop.run_in_executor(None, profiler.dump, path)
+        rows = await self.bot.loop.run_in_executor(None, profiler.top, 15, project_only)
+
+        embed = create_default_embed(ctx)
+        embed.title = 'Profile Results'
+        if sampling:
+            lines = [f'`{cumulative:5.1f}% {own:5.1f}%` {discord.utils.escape_markdown(function, as_needed=True)}'
+                     for function, cumulative, own in rows]
+            header = f'{profiler.samples} samples. Cumulative % / own %:\n'
+        else:
+            lines = [f'`{cumulative:7.3f}s {own:7.3f}s` {discord.utils.escape_markdown(function, as_needed=True)}'
+                     for function, cumulative, own in rows]
+            header = 'Cumulative / own time:\n'
+        description = header
+        for line in lines:
+            if len(description) + len(line) > 4000:
+                break
+            description += line + '\n'
+        embed.description = description
+        embed.set_footer(text=f'Saved to {path}')
+        await ctx.send(embed=embed)
+
     @admin.command(name='leave')
     @is_owner()
     async def leave_guild(self, ctx, guild_id: int):
@@ -2,7 +2,9 @@ import discord
 import traceback
 import sys
 from discord.ext import commands
+import bot_config as config
 from utils.errors import InvalidArgument, UnauthorizedServer, IsNotDM
+from utils.tracing import ErrorThrottle
 
 import sentry_sdk
 import logging
@@ -14,6 +16,7 @@ class CommandErrorHandler(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
+        self.throttle = ErrorThrottle(limit=config.SENTRY_ERROR_LIMIT, window=config.SENTRY_ERROR_WINDOW)
 
     def log_error(self, error=None, context=None):
         # https://github.com/avrae/avrae/blob/master/dbot.py#L114
@@ -21,6 +24,12 @@ class CommandErrorHandler(commands.Cog):
             log.warning('SENTRY Error Handling is not setup.')
             return
 
+        command = context.command.qualified_name if context.command is not None else None
+        if not self.throttle.allow(error, command):
+            log.info(f'Not logging repeated {type(error).__name__} to SENTRY '
+                     f'({self.throttle.suppressed} suppressed so far).')
+            return
+
         with sentry_sdk.push_scope() as scope:
             scope.user = {"id": context.author.id, "username": str(context.author)}
             scope.set_tag("message.content", context.message.content)
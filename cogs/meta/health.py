@@ -0,0 +1,166 @@
+import asyncio
+import logging
+import time
+
+from aiohttp import web
+from discord.ext import commands
+
+import bot_config as config
+
+log = logging.getLogger(__name__)
+
+# How long a Mongo ping result is reused for, so frequent probes don't hit the database every time.
+MONGO_PING_CACHE_SECONDS = 5
+
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metric_lines(name: str, kind: str, help_text: str, values) -> list:
+    """
+    Formats one metric in the Prometheus text format.
+
+    :param values: List of (labels dict, value) tuples.
+    """
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in values:
+        if labels:
+            label_text = ','.join(f'{key}="{escape_label(val)}"' for key, val in labels.items())
+            lines.append(f'{name}{{{label_text}}} {value}')
+        else:
+            lines.append(f'{name} {value}')
+    return lines
+
+
+class Health(commands.Cog):
+    """
+    Local HTTP endpoints for liveness, readiness and metrics probes.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.runner = None
+        self._mongo_ok = (0, False)
+        if config.HEALTH_PORT:
+            task = self.bot.loop.create_task(self.start_server())
+            task.add_done_callback(self._server_started)
+        else:
+            log.warning('HEALTH_PORT not set, not starting health server.')
+
+    def cog_unload(self):
+        if self.runner is not None:
+            self.bot.loop.create_task(self.runner.cleanup())
+
+    @staticmethod
+    def _server_started(task):
+        if not task.cancelled() and task.exception() is not None:
+            log.error('Could not start the health server.', exc_info=task.exception())
+
+    async def start_server(self):
+        app = web.Application()
+        app.router.add_get('/healthz', self.healthz)
+        app.router.add_get('/readyz', self.readyz)
+        app.router.add_get('/metrics', self.metrics)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, config.HEALTH_HOST, config.HEALTH_PORT)
+        await site.start()
+        log.info(f'Health server listening on {config.HEALTH_HOST}:{config.HEALTH_PORT}')
+
+    async def mongo_reachable(self) -> bool:
+        checked_at, ok = self._mongo_ok
+        if time.monotonic() - checked_at < MONGO_PING_CACHE_SECONDS:
+            return ok
+        try:
+            await asyncio.wait_for(self.bot.mdb.command('ping'), timeout=2)
+            ok = True
+        except Exception:
+            ok = False
+        self._mongo_ok = (time.monotonic(), ok)
+        return ok
+
+    # ---- Endpoints ----
+    async def healthz(self, request):
+        # Answering at all means the loop is running.
+        return web.Response(text='ok')
+
+    async def readyz(self, request):
+        checks = {
+            'gateway': self.bot.is_ready() and not self.bot.is_closed(),
+            'mongo': await self.mongo_reachable(),
+            'settings': self.bot.settings_loaded
+        }
+        body = '\n'.join(f'{name}: {"ok" if ok else "failing"}' for name, ok in checks.items())
+        return web.Response(text=body, status=200 if all(checks.values()) else 503)
+
+    async def metrics(self, request):
+        bot = self.bot
+        lines = []
+        lines += metric_lines('frogbot_uptime_seconds', 'gauge', 'Seconds since the bot started.',
+                              [({}, bot.uptime.total_seconds())])
+        lines += metric_lines('frogbot_ready', 'gauge', 'Whether the gateway is ready.',
+                              [({}, int(bot.is_ready()))])
+        lines += metric_lines('frogbot_gateway_latency_seconds', 'gauge', 'Gateway heartbeat latency.',
+                              [({}, bot.latency if bot.latency == bot.latency else 0)])
+        lines += metric_lines('frogbot_guilds', 'gauge', 'Guilds the bot is in.', [({}, len(bot.guilds))])
+
+        buffered = bot.ready_buffer.stats()
+        lines += metric_lines('frogbot_ready_buffer_messages_total', 'counter',
+                              'Messages received before ready, by outcome.',
+                              [({'outcome': outcome}, buffered[outcome])
+                               for outcome in ('replayed', 'dropped_overflow', 'dropped_stale')])
+
+        members = bot.members.stats()
+        lines += metric_lines('frogbot_member_cache_size', 'gauge', 'Lookups held by the member resolver.',
+                              [({}, members['cached'])])
+        lines += metric_lines('frogbot_member_lookups_total', 'counter', 'Member lookups by result.',
+                              [({'result': 'hit'}, members['hits']), ({'result': 'miss'}, members['misses'])])
+        lines += metric_lines('frogbot_member_queries_total', 'counter', 'Member queries sent to the gateway.',
+                              [({}, members['queries'])])
+        lines += metric_lines('frogbot_member_query_errors_total', 'counter', 'Member queries that failed.',
+                              [({}, members['errors'])])
+
+        if bot.loop_monitor is not None:
+            lines += metric_lines('frogbot_loop_lag_ms', 'gauge', 'Most recent event loop lag.',
+                                  [({}, bot.loop_monitor.last_lag)])
+            lines += metric_lines('frogbot_loop_lag_max_ms', 'gauge', 'Largest event loop lag seen.',
+                                  [({}, bot.loop_monitor.max_lag)])
+
+        lines += metric_lines('frogbot_gateway_events_total', 'counter', 'Gateway dispatches by event type.',
+                              [({'event': event}, count) for event, count in bot.gateway_stats.events.items()])
+
+        lines += metric_lines('frogbot_http_requests_total', 'counter', 'Outgoing HTTP requests by host.',
+                              [({'host': host}, stats.requests) for host, stats in bot.http_metrics.hosts.items()])
+        lines += metric_lines('frogbot_http_errors_total', 'counter', 'Failed outgoing HTTP requests by host.',
+                              [({'host': host}, stats.errors) for host, stats in bot.http_metrics.hosts.items()])
+        lines += metric_lines('frogbot_http_request_seconds_total', 'counter', 'Time spent on HTTP requests.',
+                              [({'host': host}, stats.total_time)
+                               for host, stats in bot.http_metrics.hosts.items()])
+
+        mongo = bot.mongo_metrics.summary()
+        lines += metric_lines('frogbot_mongo_commands_total', 'counter', 'Mongo commands by collection.',
+                              [({'collection': c, 'command': cmd}, stats['count']) for (c, cmd), stats in mongo])
+        lines += metric_lines('frogbot_mongo_errors_total', 'counter', 'Failed Mongo commands by collection.',
+                              [({'collection': c, 'command': cmd}, stats['errors']) for (c, cmd), stats in mongo])
+        lines += metric_lines('frogbot_mongo_command_p99_ms', 'gauge', 'Recent p99 Mongo command latency.',
+                              [({'collection': c, 'command': cmd}, stats['p99']) for (c, cmd), stats in mongo])
+
+        lines += metric_lines('frogbot_ratelimit_buckets', 'gauge', 'Rate limit buckets by policy.',
+                              [({'policy': name}, count) for name, count in bot.ratelimits.counts().items()])
+
+        # Not loaded yet if image commands are deferred.
+        jobs = getattr(bot.get_cog('Images'), 'jobs', None)
+        if jobs is not None:
+            jobs = jobs.metrics()
+            lines += metric_lines('frogbot_image_queue_depth', 'gauge', 'Queued image jobs.',
+                                  [({}, jobs['depth'])])
+            lines += metric_lines('frogbot_image_jobs_total', 'counter', 'Image jobs by outcome.',
+                                  [({'outcome': outcome}, jobs[outcome])
+                                   for outcome in ('completed', 'failed', 'rejected')])
+
+        return web.Response(text='\n'.join(lines) + '\n', content_type='text/plain')
+
+
+def setup(bot):
+    bot.add_cog(Health(bot))
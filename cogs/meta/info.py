@@ -2,7 +2,7 @@ import discord
 from discord.ext import commands
 
 from utils.constants import STATUS_EMOJIS, STATUS_NAMES, BADGE_EMOJIS, SUPPORT_SERVER_ID, DATE_FORMAT
-from utils.functions import create_default_embed, member_in_guild
+from utils.functions import create_default_embed
 
 
 class Info(commands.Cog):
@@ -19,7 +19,7 @@ class Info(commands.Cog):
         guild = ctx.guild
         embed.title = f'{guild.name} - Server Information'
         general_info = f'**ID:** {guild.id}\n' \
-                       f'**Owner:** {guild.owner.mention}\n' \
+                       f'**Owner:** <@{guild.owner_id}>\n' \
                        f'Created: {guild.created_at.strftime(DATE_FORMAT)}'
         embed.add_field(name='General Info', value=general_info, inline=False)
         emoji_x = 0
@@ -32,8 +32,8 @@ class Info(commands.Cog):
         emoji_info = f'{len(guild.emojis)} emoji{"s" if len(guild.emojis) != 1 else ""}\n' \
                      f'{",".join([str(e) for e in emojis])} {"..." if emoji_x >= 10 else ""}'
         embed.add_field(name='Emojis', value=emoji_info, inline=False)
-        bots = [member for member in guild.members if member.bot]
-        member_stats = f'{guild.member_count - len(bots)} members ({len(bots)} bots)'
+        # Members aren't chunked, so bots can't be told apart without fetching the whole list.
+        member_stats = f'{guild.member_count} members'
         embed.add_field(name='Member Info', value=member_stats)
         channels = f'{len([c for c in guild.categories])} categories, ' \
                    f'{len([c for c in guild.channels if isinstance(c, discord.TextChannel)])} text channels, ' \
@@ -48,6 +48,7 @@ class Info(commands.Cog):
     async def member_info(self, ctx, who: discord.Member = None):
         """
         Shows information about a member in this server.
+        Their online status is not shown if the bot is running in lean mode.
         """
         if who is None:
             who = ctx.author
@@ -55,10 +56,10 @@ class Info(commands.Cog):
         badges = ''
         if who.id == self.bot.owner:
             badges += f'{BADGE_EMOJIS["bot_owner"]} '
-        if who.id == ctx.guild.owner.id:
+        if who.id == ctx.guild.owner_id:
             badges += f'{BADGE_EMOJIS["server_owner"]} '
         support_server = self.bot.get_guild(SUPPORT_SERVER_ID)
-        if support_server is not None and member_in_guild(who.id, support_server):
+        if support_server is not None and await self.bot.members.fetch(support_server, who.id) is not None:
             badges += f'{BADGE_EMOJIS["support_server"]}'
 
         embed.title = f'Member Information - {who.display_name} {badges}'
@@ -67,15 +68,19 @@ class Info(commands.Cog):
         embed.add_field(name='Name', value=f'{who.mention}')
         embed.add_field(name='Username', value=f'{who.name}#{who.discriminator}')
         embed.add_field(name='ID', value=f'{who.id}')
-        embed.add_field(name='Status', value=f'Status: {STATUS_EMOJIS[str(who.status)]}'
-                                             f' ({STATUS_NAMES[str(who.status)]})')
+        if self.bot.intents.presences:
+            embed.add_field(name='Status', value=f'Status: {STATUS_EMOJIS[str(who.status)]}'
+                                                 f' ({STATUS_NAMES[str(who.status)]})')
+        else:
+            # Without the presence intent every member looks offline, and there is no other way to ask.
+            embed.add_field(name='Status', value='Status: Unavailable')
 
         # -- Roles --
         embed.add_field(name='Roles', value=f'{len(who.roles)} role(s)')
         embed.add_field(name='Top Role',
                         value=f'{who.top_role.mention if who.top_role.name != "@everyone" else "Default Role"}'
                               f' (Position {who.top_role.position}/{ctx.guild.roles[-1].position})')
-        embed.add_field(name='Is Server Owner', value=f'{"True" if ctx.guild.owner.id == who.id else "False"}')
+        embed.add_field(name='Is Server Owner', value=f'{"True" if ctx.guild.owner_id == who.id else "False"}')
 
         # -- Date Information --
         embed.add_field(name='Account Created At', value=who.created_at.strftime(DATE_FORMAT))
@@ -9,18 +9,23 @@ log = logging.getLogger(__name__)
 class KeepAlive(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
         if (url := self.bot.api_keys['server_api_url']) and (key := self.bot.api_keys['server_api_key']):
             self.url = url
             self.key = key
             self.alive_post.start()
         else:
             log.warning('Not starting Keep Alive server.')
+        self.dbl_client = None
         if (token := self.bot.api_keys['dbl_api_key']) is not None:
-            self.dbl_client = dbl.DBLClient(self.bot, token=token, autopost=True)
+            self.bot.loop.create_task(self.start_dbl(token))
         else:
             log.warning('No DBL API key token provided.')
 
+    async def start_dbl(self, token):
+        # The shared session only exists once the bot has started.
+        await self.bot.wait_until_ready()
+        self.dbl_client = dbl.DBLClient(self.bot, token=token, autopost=True, session=self.bot.session)
+
     def cog_unload(self):
         self.alive_post.cancel()
 
@@ -28,7 +33,7 @@ class KeepAlive(commands.Cog):
     async def alive_post(self):
         headers = {'x-api-key': self.key}
         try:
-            async with self.session.post(url=self.url, headers=headers) as _:
+            async with self.bot.session.post(url=self.url, headers=headers) as _:
                 pass
                 # log.info(f'Uptime Post Response: {r.status}\n{await r.text()}')
         except aiohttp.client_exceptions.ClientConnectorError:
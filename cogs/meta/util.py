@@ -1,11 +1,11 @@
-import os
 from datetime import datetime
 
-import psutil
-from discord.ext import commands
+from discord.ext import commands, tasks
 import discord
 
+import bot_config as config
 from utils.functions import create_default_embed
+from utils.system_metrics import SystemSampler
 
 
 def time_to_readable(delta_uptime):
@@ -19,6 +19,24 @@ class Utility(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self._command_count = None
+        # Recorded by FrogBot.dispatch.
+        self.gateway = bot.gateway_stats
+        self.system = SystemSampler(bot.loop, history=config.SYSTEM_SAMPLE_HISTORY)
+        self.sample_gateway.start()
+        self.sample_system.start()
+
+    def cog_unload(self):
+        self.sample_gateway.cancel()
+        self.sample_system.cancel()
+
+    @tasks.loop(seconds=config.GATEWAY_STATS_INTERVAL)
+    async def sample_gateway(self):
+        self.gateway.sample()
+
+    @tasks.loop(seconds=config.SYSTEM_SAMPLE_INTERVAL)
+    async def sample_system(self):
+        monitor = self.bot.loop_monitor
+        await self.system.sample(loop_lag=monitor.last_lag if monitor is not None else 0.0)
 
     @commands.command(name='ping')
     async def ping(self, ctx):
@@ -106,20 +124,53 @@ class Utility(commands.Cog):
         embed = create_default_embed(ctx)
         embed.title = 'FrogBot Debug'
         # -- Calculate Values --
-        proc = psutil.Process(os.getpid())
-        cpu = psutil.cpu_percent()
-        mem = psutil.virtual_memory()
-        mem_used = proc.memory_full_info().uss
         if self._command_count is None:
             self._command_count = len([command for cog in self.bot.cogs
                                        for command in self.bot.get_cog(cog).walk_commands()])
         command_count = self._command_count
         # -- Add fields ---
-        embed.add_field(name='Memory Usage', value=f'{round((mem_used / 1000000), 2)} '
-                                                   f'/ {round((mem.total / 1000000), 2)} MB '
-                                                   f'({round(100 * (mem_used / mem.total), 2)}%)')
-        embed.add_field(name='CPU Usage', value=f'{round(cpu, 2)}%')
+        latest = self.system.latest
+        if latest is not None:
+            embed.add_field(name='Memory Usage (USS)',
+                            value=f'{self.system.describe("uss", scale=1000000)} MB\n'
+                                  f'{round(100 * (latest.uss / latest.mem_total), 2)}% of '
+                                  f'{round(latest.mem_total / 1000000, 2)} MB')
+            embed.add_field(name='RSS', value=f'{self.system.describe("rss", scale=1000000)} MB')
+            embed.add_field(name='CPU Usage', value=f'{self.system.describe("cpu")}%')
+            embed.add_field(name='Open Files', value=self.system.describe('fds'))
+            embed.add_field(name='Tasks', value=self.system.describe('tasks'))
+        else:
+            embed.add_field(name='System', value='No samples yet.')
         embed.add_field(name='Commands', value=f'{command_count} total commands loaded.')
+        monitor = self.bot.loop_monitor
+        if monitor is not None:
+            loop_info = f'{self.system.describe("loop_lag")} ms\n' \
+                        f'p50: {monitor.percentile(50):.0f} ms, p99: {monitor.percentile(99):.0f} ms\n' \
+                        f'Max: {monitor.max_lag:.0f} ms'
+            if monitor.detect_slow:
+                loop_info += f'\n{len(monitor.slow_callbacks)} recent slow callback(s)'
+                if monitor.slow_callbacks:
+                    slowest = max(monitor.slow_callbacks, key=lambda c: c.duration)
+                    loop_info += f'\nSlowest: `{slowest.task}` ({slowest.duration * 1000:.0f} ms)'
+            embed.add_field(name='Event Loop Lag', value=loop_info)
+        gateway = self.gateway
+        top_events = ', '.join(f'{event} ({count})' for event, count in gateway.recent_events().most_common(3))
+        top_intents = ', '.join(f'{intent} ({count})' for intent, count in gateway.by_intent().most_common(3))
+        gateway_info = f'{gateway.rate():.2f} events/sec\n' \
+                       f'Top events: {top_events or "None"}\n' \
+                       f'Top intents: {top_intents or "None"}'
+        if gateway.track_guilds:
+            top_guilds = []
+            for guild_id, count in gateway.guilds.most_common(3):
+                guild = self.bot.get_guild(int(guild_id))
+                top_guilds.append(f'{guild.name if guild else guild_id} ({count})')
+            gateway_info += f'\nTop guilds: {", ".join(top_guilds) or "None"}'
+        embed.add_field(name='Gateway', value=gateway_info, inline=False)
+        buckets = '\n'.join(f'{name}: {count}' for name, count in self.bot.ratelimits.counts().items()) or 'None'
+        embed.add_field(name='Rate Limit Buckets', value=f'{buckets}\n{self.bot.ratelimits.evicted} evicted')
+        hosts = [f'{host}: {stats.requests} req, {stats.errors} err, {stats.avg_time * 1000:.0f} ms avg'
+                 for host, stats in self.bot.http_metrics.top_hosts()]
+        embed.add_field(name='HTTP', value='\n'.join(hosts) or 'No requests yet.', inline=False)
 
         await ctx.send(embed=embed)
 
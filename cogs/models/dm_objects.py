@@ -11,7 +11,7 @@ class DMCategory:
         self._channels = channels
 
     @classmethod
-    def from_dict(cls, bot, data):
+    async def from_dict(cls, bot, data):
         if not isinstance(data['guild_id'], int):
             raise InvalidArgument('Guild ID must be an Int.')
         guild = bot.get_guild(data['guild_id'])
@@ -19,7 +19,11 @@ class DMCategory:
             raise InvalidArgument('Guild must exist.')
         if not isinstance(data['owner_id'], int):
             raise InvalidArgument('Owner ID must be an int.')
-        owner = guild.get_member(data['owner_id'])
+        # Resolve the owner and every member with a permission in one batch.
+        member_ids = [data['owner_id']] + [perm['obj_id'] for channel in data['channels']
+                                           for perm in channel['permissions'] if perm['type'] == 1]
+        members = await bot.members.fetch_many(guild, member_ids)
+        owner = members.get(data['owner_id'])
         if owner is None:
             raise InvalidArgument('Owner must exist.')
         if not isinstance(data['category_id'], int):
@@ -28,7 +32,7 @@ class DMCategory:
         if category is None:
             raise InvalidArgument('Category must exist.')
         this = cls(owner, category, guild, channels=[])
-        channels = [DMChannel.from_dict(this, x) for x in data['channels']]
+        channels = [DMChannel.from_dict(this, x, members) for x in data['channels']]
         channels = [channel for channel in channels if channel is not None]
         this.channels = channels
         return this
@@ -85,7 +89,7 @@ class DMCategory:
         existing = await ctx.bot.mdb['dmcategories'].find_one({'owner_id': ctx.author.id, 'guild_id': ctx.guild.id})
         if existing is not None:
             existing.pop('_id')
-            return cls.from_dict(ctx.bot, existing)
+            return await cls.from_dict(ctx.bot, existing)
         else:
             return None
 
@@ -159,13 +163,16 @@ class DMChannel:
         self._channel = channel
 
     @classmethod
-    def from_dict(cls, category, data: dict):
+    def from_dict(cls, category, data: dict, members: dict):
+        """
+        :param members: Members the permissions may refer to, by ID.
+        """
         if not isinstance(data['channel_id'], int):
             raise InvalidArgument('Channel ID must be an int.')
         channel = category.guild.get_channel(data['channel_id'])
         if channel is None:
             return None
-        permissions = [DMPermissions.from_dict(category.guild, x) for x in data['permissions']]
+        permissions = [DMPermissions.from_dict(category.guild, x, members) for x in data['permissions']]
         return cls(category, permissions, channel)
 
     def to_dict(self):
@@ -237,7 +244,10 @@ class DMPermissions:
         self._guild = guild
 
     @classmethod
-    def from_dict(cls, guild: Guild, data: dict):
+    def from_dict(cls, guild: Guild, data: dict, members: dict):
+        """
+        :param members: Members the permission may refer to, by ID.
+        """
         if not isinstance(data['type'], int) or not (0 <= data['type'] <= 2):
             raise InvalidArgument('Type must be 0, 1, or 2.')
         type_ = data['type']
@@ -248,7 +258,7 @@ class DMPermissions:
         if type_ == 0:
             obj = guild.get_role(data['obj_id'])
         elif type_ == 1:
-            obj = guild.get_member(data['obj_id'])
+            obj = members.get(data['obj_id'])
         elif type_ == 2:
             obj = guild.default_role
         if obj is None:
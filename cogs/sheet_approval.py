@@ -1,27 +1,81 @@
+import asyncio
+import collections
 import logging
+import time
+from datetime import datetime, timedelta
 
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
+from pymongo.errors import PyMongoError
 
+import bot_config as config
 from utils.checks import is_personal_server, is_owner
 from utils.constants import BOT_MODS, APPROVAL_ROLES, ROLES_CHANNEL, AVRAE_CHANNEL
 from utils.functions import create_default_embed
 
 log = logging.getLogger('sheet approval')
 
+CleanupReport = collections.namedtuple('CleanupReport', ['checked', 'pruned', 'skipped', 'elapsed'])
+
+# Channels holding at least this many pending sheets get one history scan instead of per-message fetches.
+HISTORY_SCAN_THRESHOLD = 25
+
+# Age boundaries (in days) for the sheet queue, from oldest to newest, with the label of the bucket after each.
+QUEUE_AGE_BUCKETS = ((30, '7-30 days'), (7, '1-7 days'), (1, '< 1 day'))
+
+# Discord's message length limit, used when splitting approval digests.
+MESSAGE_LIMIT = 2000
+
+
+def approval_message(member, description, sheet_channel_id) -> str:
+    return f'{member.mention}, your character with the following content has been approved:\n' \
+           f'```\n{description}\n```\n' \
+           f'Check your submission in <#{sheet_channel_id}> for details on what to do next.'
+
+
+def approval_digest(approved, sheet_channel_id) -> list:
+    """
+    Builds one announcement for a batch of approvals, split into as few messages as Discord allows.
+
+    :param approved: List of (Member, sheet description) tuples.
+    :return: List of message contents.
+    """
+    header = f'The following character{"s have" if len(approved) != 1 else " has"} been approved:\n'
+    footer = f'\nCheck your submissions in <#{sheet_channel_id}> for details on what to do next.'
+    lines = []
+    for member, description in approved:
+        summary = (description or '').strip().splitlines()[0:1]
+        summary = summary[0] if summary else ''
+        if len(summary) > 100:
+            summary = summary[:97] + '...'
+        lines.append(f':white_small_square: {member.mention} - {discord.utils.escape_markdown(summary)}')
+
+    messages = []
+    current = header
+    for line in lines:
+        if len(current) + len(line) + len(footer) + 1 > MESSAGE_LIMIT:
+            messages.append(current)
+            current = ''
+        current += line + '\n'
+    messages.append(current + footer)
+    return messages
+
 
 class ToBeApproved:
-    def __init__(self, message_id: int, approvals: list, channel_id: int, owner_id: int):
+    def __init__(self, message_id: int, approvals: list, channel_id: int, owner_id: int,
+                 created_at: datetime = None):
         """
         :param message_id: ID of Message that created this.
         :param approvals: List of Member ID's who have approved the Sheet
         :param channel_id: Channel ID that the message was sent in
         :param owner_id: Member ID of owner of sheet.
+        :param created_at: When the sheet was submitted. Defaults to the creation time of the message.
         """
         self.message_id = message_id
         self.approvals = approvals
         self.channel_id = channel_id
         self.owner_id = owner_id
+        self.created_at = created_at or discord.utils.snowflake_time(message_id)
 
     @classmethod
     def from_dict(cls, data):
@@ -32,7 +86,8 @@ class ToBeApproved:
             'message_id': self.message_id,
             'approvals': self.approvals,
             'channel_id': self.channel_id,
-            'owner_id': self.owner_id
+            'owner_id': self.owner_id,
+            'created_at': self.created_at
         }
 
     async def get_message(self, guild):
@@ -42,18 +97,30 @@ class ToBeApproved:
         return msg
 
     async def commit(self, db):
-        db.update_one({'message_id': self.message_id}, {'$set': self.to_dict()}, upsert=True)
+        await db.update_one({'message_id': self.message_id}, {'$set': self.to_dict()}, upsert=True)
+
+    async def archive(self, mdb, approved_at: datetime = None):
+        """
+        Moves an approved sheet out of `to_approve` and into the `approved_sheets` archive.
+
+        :param approved_at: When the sheet was approved, defaults to now.
+        """
+        data = self.to_dict()
+        data['approved_at'] = approved_at or datetime.utcnow()
+        await mdb['approved_sheets'].update_one({'message_id': self.message_id}, {'$set': data}, upsert=True)
+        await mdb['to_approve'].delete_one({'message_id': self.message_id})
 
     async def fields(self, guild, bot):
         message = await self.get_message(guild)
         embed = message.embeds[0]
         embed.clear_fields()
+        members = await bot.members.fetch_many(guild, self.approvals + [self.owner_id])
         for approval in self.approvals:
-            x = guild.get_member(approval)
+            x = members.get(approval)
             if x is not None:
                 embed.add_field(name='Approval', value=x.display_name)
-        if len(self.approvals) >= 2:
-            mention = guild.get_member(self.owner_id)
+        mention = members.get(self.owner_id)
+        if len(self.approvals) >= 2 and mention is not None:
             embed.add_field(name=f'Approved!',
                             value=f'{mention.mention}, Your character has been approved! '
                                   f'Go to {ROLES_CHANNEL} and grab your player roles,'
@@ -63,10 +130,13 @@ class ToBeApproved:
             if bot.personal_server['general_channel'] is not None:
                 general = guild.get_channel(bot.personal_server['general_channel'])
             if general is not None:
-                await general.send(f'{mention.mention}, your character with the following content has been approved:\n'
-                                   f'```\n{embed.description}\n```\n'
-                                   f'Check your submission in {self.bot.personal_server["sheet_channel"]} for details on what to do next.',
-                                   allowed_mentions=discord.AllowedMentions(users=[mention]))
+                cog = bot.get_cog('SheetApproval')
+                if cog is not None:
+                    await cog.announce_approval(general, mention, embed.description)
+                else:
+                    await general.send(approval_message(mention, embed.description,
+                                                        bot.personal_server['sheet_channel']),
+                                       allowed_mentions=discord.AllowedMentions(users=[mention]))
         await message.edit(embed=embed)
 
     async def add_approval(self, guild, approver, bot):
@@ -83,17 +153,16 @@ class ToBeApproved:
             await self.fields(guild, bot)
 
     async def remove_approval(self, guild, user_id, bot):
-        member = guild.get_member(user_id)
-        if member.id not in self.approvals:
+        if user_id not in self.approvals:
             return
-        self.approvals.remove(member.id)
+        self.approvals.remove(user_id)
         await self.fields(guild, bot)
 
     async def approve(self, guild, bot):
         if len(self.approvals) < 2:
             return
         await self.fields(guild, bot)
-        member = guild.get_member(self.owner_id)
+        member = await bot.members.fetch(guild, self.owner_id)
         if member is None:
             return None
         # Add Player Role
@@ -111,6 +180,101 @@ class ToBeApproved:
 class SheetApproval(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self._pending_announcements = collections.defaultdict(list)
+        self._digest_tasks = {}
+        self._queue_cache = (0, None)
+        self.bot.loop.create_task(self.prepare_collections())
+        self.scheduled_cleanup.start()
+
+    def cog_unload(self):
+        self.scheduled_cleanup.cancel()
+        for task in self._digest_tasks.values():
+            task.cancel()
+
+    async def announce_approval(self, channel, member, description):
+        """
+        Announces an approved sheet in `channel`.
+
+        If `APPROVAL_DIGEST_SECONDS` is set, approvals are collected for that long and sent as one digest
+        instead of one message per approval.
+        """
+        sheet_channel_id = self.bot.personal_server['sheet_channel']
+        if config.APPROVAL_DIGEST_SECONDS <= 0:
+            return await channel.send(approval_message(member, description, sheet_channel_id),
+                                      allowed_mentions=discord.AllowedMentions(users=[member]))
+
+        self._pending_announcements[channel.id].append((member, description))
+        if channel.id not in self._digest_tasks:
+            self._digest_tasks[channel.id] = self.bot.loop.create_task(self._send_digest(channel))
+
+    async def _send_digest(self, channel):
+        try:
+            await asyncio.sleep(config.APPROVAL_DIGEST_SECONDS)
+        except asyncio.CancelledError:
+            # Cancelled by cog_unload: send what was collected so far rather than dropping it.
+            self.bot.loop.create_task(self._flush_digest(channel))
+            raise
+        await self._flush_digest(channel)
+
+    async def _flush_digest(self, channel):
+        self._digest_tasks.pop(channel.id, None)
+        approved = self._pending_announcements.pop(channel.id, [])
+        if not approved:
+            return
+        mentions = discord.AllowedMentions(users=[member for member, _ in approved])
+        for content in approval_digest(approved, self.bot.personal_server['sheet_channel']):
+            await channel.send(content, allowed_mentions=mentions)
+
+    async def update_expiry_index(self, hot):
+        """
+        Creates the TTL index on `created_at`, or changes its expiry if `SHEET_EXPIRE_DAYS` has changed.
+
+        `create_index` refuses to change the options of an existing index, so that is done with `collMod`.
+        """
+        expire_after = int(timedelta(days=config.SHEET_EXPIRE_DAYS).total_seconds())
+        index = (await hot.index_information()).get('created_at_1')
+        if index is None:
+            await hot.create_index('created_at', expireAfterSeconds=expire_after)
+        elif index.get('expireAfterSeconds') != expire_after:
+            await self.bot.mdb.command('collMod', hot.name,
+                                       index={'keyPattern': {'created_at': 1}, 'expireAfterSeconds': expire_after})
+            log.info(f'Sheet expiry changed from {index.get("expireAfterSeconds")}s to {expire_after}s.')
+
+    async def prepare_collections(self):
+        """
+        Creates the sheet indexes and moves any approved sheets left in `to_approve` into the archive.
+
+        `to_approve` only holds pending sheets, which expire through a TTL index on `created_at`.
+        """
+        try:
+            await self._prepare_collections()
+        except PyMongoError:
+            log.exception('Could not prepare the sheet collections.')
+
+    async def _prepare_collections(self):
+        hot, cold = self.bot.mdb['to_approve'], self.bot.mdb['approved_sheets']
+        await hot.create_index('message_id')
+        try:
+            await self.update_expiry_index(hot)
+        except PyMongoError:
+            # Not worth skipping the migration below for.
+            log.exception('Could not update the sheet expiry index.')
+        await cold.create_index('message_id', unique=True)
+        await cold.create_index('owner_id')
+
+        moved = 0
+        async for data in hot.find({'approvals.1': {'$exists': True}}, {'_id': 0}):
+            # When they were approved wasn't recorded, the sheet message's own timestamp is the closest there is.
+            sheet = ToBeApproved.from_dict(data)
+            await sheet.archive(self.bot.mdb, approved_at=discord.utils.snowflake_time(sheet.message_id))
+            moved += 1
+        if moved:
+            log.info(f'Archived {moved} approved sheet{"s" if moved != 1 else ""}.')
+
+        # Older sheets have no created_at, so the TTL index would never expire them.
+        async for data in hot.find({'created_at': {'$exists': False}}, {'_id': 0, 'message_id': 1}):
+            await hot.update_one({'message_id': data['message_id']},
+                                 {'$set': {'created_at': discord.utils.snowflake_time(data['message_id'])}})
 
     async def sheet_from_emoji(self, payload) -> ToBeApproved:
         # Check the Guild
@@ -121,7 +285,7 @@ class SheetApproval(commands.Cog):
         # Check the Roles
         member = payload.member
         if member is None:
-            member = self.bot.get_guild(guild_id).get_member(payload.user_id)
+            member = await self.bot.members.fetch(self.bot.get_guild(guild_id), payload.user_id)
             if member is None:
                 return None
         if len([role for role in member.roles if role.name.lower() in APPROVAL_ROLES]) == 0:
@@ -148,7 +312,10 @@ class SheetApproval(commands.Cog):
         guild = self.bot.get_guild(payload.guild_id)
 
         await sheet.add_approval(guild, payload.member, self.bot)
-        await sheet.commit(self.bot.mdb['to_approve'])
+        if len(sheet.approvals) >= 2:
+            await sheet.archive(self.bot.mdb)
+        else:
+            await sheet.commit(self.bot.mdb['to_approve'])
 
     @commands.Cog.listener('on_raw_reaction_remove')
     async def check_for_deny(self, payload):
@@ -160,7 +327,7 @@ class SheetApproval(commands.Cog):
         await sheet.remove_approval(guild, payload.user_id, self.bot)
         await sheet.commit(self.bot.mdb['to_approve'])
 
-    @commands.command(name='sheet', aliases=['submit'])
+    @commands.group(name='sheet', aliases=['submit'], invoke_without_command=True)
     @is_personal_server()
     async def new_sheet(self, ctx, *, content: str):
         """
@@ -185,31 +352,208 @@ class SheetApproval(commands.Cog):
                                  owner_id=ctx.author.id)
         await self.bot.mdb['to_approve'].insert_one(new_sheet.to_dict())
 
-    @commands.command('cleanup_sheets')
+    async def queue_stats(self) -> dict:
+        """
+        Aggregates the state of the approval queue, caching the result for `SHEET_QUEUE_CACHE_SECONDS`.
+        """
+        cached_at, stats = self._queue_cache
+        if stats is not None and time.monotonic() - cached_at < config.SHEET_QUEUE_CACHE_SECONDS:
+            return stats
+
+        # Mongo stores milliseconds, so keep the boundaries whole to match the returned bucket ids.
+        now = datetime.utcnow().replace(microsecond=0)
+        boundaries = [datetime(2015, 1, 1)] + [now - timedelta(days=d) for d, _ in QUEUE_AGE_BUCKETS] + \
+                     [now + timedelta(days=1)]
+        pipeline = [
+            {'$facet': {
+                'pending': [{'$count': 'count'}],
+                'ages': [{'$bucket': {'groupBy': '$created_at', 'boundaries': boundaries, 'default': 'unknown'}}],
+                'oldest': [
+                    {'$sort': {'created_at': 1}},
+                    {'$limit': 5},
+                    {'$project': {'_id': 0, 'message_id': 1, 'channel_id': 1, 'owner_id': 1, 'created_at': 1}}
+                ]
+            }}
+        ]
+        # Approved sheets live in the archive, so approver totals come from there.
+        approver_pipeline = [
+            {'$match': {'approved_at': {'$gte': now - timedelta(days=30)}}},
+            {'$unwind': '$approvals'},
+            {'$group': {'_id': '$approvals', 'count': {'$sum': 1}}},
+            {'$sort': {'count': -1}},
+            {'$limit': 5}
+        ]
+        result, approvers = await asyncio.gather(
+            self.bot.mdb['to_approve'].aggregate(pipeline).to_list(None),
+            self.bot.mdb['approved_sheets'].aggregate(approver_pipeline).to_list(None)
+        )
+        result = result[0]
+
+        # Each bucket's id is its lower boundary, and the oldest bucket comes first.
+        labels = [label for _, label in QUEUE_AGE_BUCKETS]
+        labels.insert(0, f'{QUEUE_AGE_BUCKETS[0][0]}+ days')
+        ages = {label: 0 for label in labels}
+        for bucket in result['ages']:
+            if bucket['_id'] in boundaries:
+                ages[labels[boundaries.index(bucket['_id'])]] += bucket['count']
+
+        stats = {
+            'pending': result['pending'][0]['count'] if result['pending'] else 0,
+            'ages': ages,
+            'approvers': [(a['_id'], a['count']) for a in approvers],
+            'oldest': result['oldest']
+        }
+        self._queue_cache = (time.monotonic(), stats)
+        return stats
+
+    @new_sheet.command(name='queue')
     @is_personal_server()
     @commands.check_any(is_owner(), commands.has_any_role(*BOT_MODS))
-    async def remove_sheets(self, ctx):
+    async def sheet_queue(self, ctx):
         """
-        Removes deleted sheets from database. Run every once and a while.
+        Shows how many sheets are waiting for approval, how old they are, and who has been approving them.
         """
-        db = self.bot.mdb['to_approve']
-
+        stats = await self.queue_stats()
         embed = create_default_embed(ctx)
-        embed.title = f'Pruning Old Sheets from Database.'
-        all_sheets = await db.find().to_list(None)
-        count = 0
-        for sheet in all_sheets:
-            sheet.pop('_id')
-            sheet = ToBeApproved.from_dict(sheet)
-            channel = ctx.guild.get_channel(sheet.channel_id)
+        embed.title = 'Sheet Approval Queue'
+        embed.description = f'{stats["pending"]} sheet{"s" if stats["pending"] != 1 else ""} waiting for approval.'
+
+        embed.add_field(name='Age', value='\n'.join(f'{label}: {count}' for label, count in stats['ages'].items()))
+
+        approvers = []
+        members = await self.bot.members.fetch_many(ctx.guild, [member_id for member_id, _ in stats['approvers']])
+        for member_id, count in stats['approvers']:
+            member = members.get(member_id)
+            approvers.append(f'{member.display_name if member else member_id}: {count}')
+        embed.add_field(name='Top Approvers (30 days)', value='\n'.join(approvers) or 'None')
+
+        oldest = []
+        for sheet in stats['oldest']:
+            link = f'https://discord.com/channels/{ctx.guild.id}/{sheet["channel_id"]}/{sheet["message_id"]}'
+            oldest.append(f'[<@{sheet["owner_id"]}> - {sheet["created_at"].strftime("%Y-%m-%d")}]({link})')
+        embed.add_field(name='Oldest Pending', value='\n'.join(oldest) or 'None', inline=False)
+
+        await ctx.send(embed=embed)
+
+    async def _existing_by_fetch(self, channel, message_ids) -> set:
+        """
+        Checks which of `message_ids` still exist in `channel` with a bounded number of concurrent fetches.
+        """
+        semaphore = asyncio.Semaphore(config.SHEET_CLEANUP_CONCURRENCY)
+        existing = set()
+
+        async def check(message_id):
+            async with semaphore:
+                try:
+                    await channel.fetch_message(message_id)
+                except discord.NotFound:
+                    return
+                except discord.HTTPException:
+                    pass  # Unknown state, keep the sheet.
+                existing.add(message_id)
+
+        await asyncio.gather(*(check(message_id) for message_id in message_ids))
+        return existing
+
+    async def _existing_by_history(self, channel, message_ids) -> set:
+        """
+        Checks which of `message_ids` still exist in `channel` by scanning its history once,
+        starting just before the oldest pending sheet.
+        """
+        wanted = set(message_ids)
+        existing = set()
+        after = discord.Object(id=min(wanted) - 1)
+        newest = max(wanted)
+        async for message in channel.history(limit=None, after=after, oldest_first=True):
+            if message.id in wanted:
+                existing.add(message.id)
+            if message.id >= newest:
+                break
+        return existing
+
+    async def prune_sheets(self, guild) -> CleanupReport:
+        """
+        Removes sheets whose messages no longer exist from the database.
+
+        The `to_approve` cursor is streamed in batches and grouped per channel, each channel is checked either
+        with one history scan or bounded concurrent fetches, and all stale sheets are removed with one `delete_many`.
+        """
+        db = self.bot.mdb['to_approve']
+        start = time.monotonic()
+
+        by_channel = collections.defaultdict(list)
+        checked = 0
+        cursor = db.find({}, {'_id': 0, 'message_id': 1, 'channel_id': 1}) \
+            .batch_size(config.SHEET_CLEANUP_BATCH_SIZE)
+        async for sheet in cursor:
+            checked += 1
+            by_channel[sheet['channel_id']].append(sheet['message_id'])
+
+        stale = []
+        skipped = 0
+        for channel_id, message_ids in by_channel.items():
+            channel = guild.get_channel(channel_id)
             if channel is None:
+                skipped += len(message_ids)
                 continue
             try:
-                await channel.fetch_message(sheet.message_id)
-            except discord.NotFound:
-                count += 1
-                await db.delete_one({'message_id': sheet.message_id})
-        embed.description = f'Pruned {count} Sheet{"s" if count != 1 else ""} from the DB.'
+                if len(message_ids) >= HISTORY_SCAN_THRESHOLD:
+                    existing = await self._existing_by_history(channel, message_ids)
+                else:
+                    existing = await self._existing_by_fetch(channel, message_ids)
+            except discord.Forbidden:
+                skipped += len(message_ids)
+                continue
+            except discord.HTTPException as e:
+                # Discord errors and outages: leave the channel for the next run rather than guessing.
+                log.warning(f'Sheet cleanup skipped channel {channel_id}: {e}')
+                skipped += len(message_ids)
+                continue
+            stale.extend(message_id for message_id in message_ids if message_id not in existing)
+
+        if stale:
+            await db.delete_many({'message_id': {'$in': stale}})
+
+        return CleanupReport(checked=checked, pruned=len(stale), skipped=skipped, elapsed=time.monotonic() - start)
+
+    @tasks.loop(hours=config.SHEET_CLEANUP_HOURS)
+    async def scheduled_cleanup(self):
+        server_id = self.bot.personal_server['server_id']
+        guild = self.bot.get_guild(server_id or 0)
+        if guild is None:
+            log.warning(f'Skipping scheduled sheet cleanup, personal server {server_id} not found.')
+            return
+        try:
+            report = await self.prune_sheets(guild)
+        except (discord.HTTPException, PyMongoError):
+            # An unhandled error would stop the loop for good, so log it and try again next time.
+            log.exception('Scheduled sheet cleanup failed.')
+            return
+        log.info(f'Scheduled sheet cleanup: checked {report.checked}, pruned {report.pruned}, '
+                 f'skipped {report.skipped} in {report.elapsed:.2f}s')
+
+    @scheduled_cleanup.before_loop
+    async def before_scheduled_cleanup(self):
+        await self.bot.wait_until_ready()
+        # The personal server is loaded by db_update after ready, so wait for it before the first run.
+        while not self.bot.settings_loaded:
+            await asyncio.sleep(5)
+
+    @commands.command('cleanup_sheets')
+    @is_personal_server()
+    @commands.check_any(is_owner(), commands.has_any_role(*BOT_MODS))
+    async def remove_sheets(self, ctx):
+        """
+        Removes deleted sheets from database. Also runs automatically on a schedule.
+        """
+        embed = create_default_embed(ctx)
+        embed.title = f'Pruning Old Sheets from Database.'
+        async with ctx.typing():
+            report = await self.prune_sheets(ctx.guild)
+        embed.description = f'Pruned {report.pruned} Sheet{"s" if report.pruned != 1 else ""} from the DB.'
+        embed.add_field(name='Checked', value=f'{report.checked}')
+        embed.add_field(name='Skipped', value=f'{report.skipped}')
+        embed.add_field(name='Time Taken', value=f'{report.elapsed:.2f}s')
         await ctx.send(embed=embed)
 
 
@@ -1,6 +1,6 @@
+import asyncio
 import datetime as datetime
 import logging
-import sys
 
 import discord
 import motor.motor_asyncio
@@ -9,13 +9,23 @@ from discord.ext import commands, tasks
 import bot_config as config
 from utils.context import Context as CustomContext
 from utils.functions import try_delete
+from utils.gateway_stats import GatewayStats
+from utils.http import HTTPMetrics, create_session
+from utils.lazy_cogs import LazyExtensions, parse_extensions
+from utils.logs import parse_levels, setup_logging
+from utils.loop_monitor import LoopMonitor
+from utils.members import MemberResolver
+from utils.mongo_monitor import MongoMetrics
+from utils.ratelimit import RateLimiter, parse_policies
+from utils.ready_buffer import ReadyBuffer
+from utils import tracing
 
 import sentry_sdk
 
 COGS = (
     'cogs.meta.util', 'jishaku', 'cogs.meta.admin', 'cogs.meta.error_handling', 'cogs.meta.info',
-    'cogs.meta.keep_alive', 'cogs.custom_commands', 'cogs.fun', 'cogs.moderation', 'cogs.images',
-    'cogs.quest_roles', 'cogs.dm_commands', 'cogs.sheet_approval',
+    'cogs.meta.keep_alive', 'cogs.meta.health', 'cogs.custom_commands', 'cogs.fun', 'cogs.moderation',
+    'cogs.images', 'cogs.quest_roles', 'cogs.dm_commands', 'cogs.sheet_approval',
     'cogs.meta.help'
 )
 
@@ -42,9 +52,13 @@ class FrogBot(commands.Bot):
         self.launch_time = datetime.datetime.utcnow()
         self._dev_id = config.DEV_ID
         self._prefix = config.PREFIX
-        self.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(config.MONGO_URL)
+        self.mongo_metrics = MongoMetrics()
+        self.mongo_client = motor.motor_asyncio.AsyncIOMotorClient(config.MONGO_URL,
+                                                                   event_listeners=[self.mongo_metrics])
         self.mdb = self.mongo_client[config.MONGO_DB]
         self.muted = set()
+        # Set once db_update has loaded settings, status and muted users.
+        self.settings_loaded = False
         self.prefixes = dict()
         self.api_keys = {
             'dbl_api_key': config.DBL_API_KEY,
@@ -58,7 +72,21 @@ class FrogBot(commands.Bot):
             'general_channel': None
         }
         self.sentry_url = config.SENTRY_URL
+        # Shared HTTP session for every cog, created once the loop is running in `start`.
+        self.session = None
+        self.http_metrics = HTTPMetrics()
+        self.gateway_stats = GatewayStats(track_guilds=config.GATEWAY_GUILD_STATS,
+                                          history=config.GATEWAY_STATS_HISTORY)
+        self.loop_monitor = None
+        self.ready_buffer = ReadyBuffer(size=config.READY_BUFFER_SIZE, max_age=config.READY_BUFFER_MAX_AGE)
+        self.ratelimits = RateLimiter(parse_policies(config.RATELIMIT_POLICIES),
+                                      max_buckets=config.RATELIMIT_MAX_BUCKETS)
         super(FrogBot, self).__init__(command_prefix, description=desc, **options)
+        self.members = MemberResolver(self.loop, max_size=config.MEMBER_CACHE_SIZE, ttl=config.MEMBER_CACHE_TTL,
+                                      absent_ttl=config.MEMBER_ABSENT_TTL)
+        self.lazy_cogs = LazyExtensions(self, deferred=parse_extensions(config.LAZY_COGS))
+        self.before_invoke(self._finish_check_span)
+        self._trace_http()
 
     @property
     def uptime(self):
@@ -90,37 +118,82 @@ class FrogBot(commands.Bot):
         self.muted = muted
         return muted
 
+    def _trace_http(self):
+        """
+        Wraps Discord REST requests in tracing spans when they happen inside a traced command.
+        """
+        request = self.http.request
+
+        async def traced_request(route, **kwargs):
+            with tracing.span('http.discord', f'{route.method} {route.path}'):
+                return await request(route, **kwargs)
+
+        self.http.request = traced_request
+
+    @staticmethod
+    async def _finish_check_span(ctx):
+        check_span = getattr(ctx, 'check_span', None)
+        if check_span is not None:
+            check_span.finish()
+            ctx.check_span = None
+
     # ---- Overrides ----
+    def dispatch(self, event_name, *args, **kwargs):
+        # Counted here rather than in a listener, which would schedule a task for every gateway message.
+        if event_name == 'socket_response':
+            self.gateway_stats.record(args[0])
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def invoke(self, ctx):
+        if ctx.command is not None and self.lazy_cogs.is_stub(ctx.command):
+            ctx = await self.lazy_cogs.load_for(ctx)
+        if not tracing.enabled or ctx.command is None:
+            return await super().invoke(ctx)
+        with tracing.command_transaction(ctx):
+            # Finished by the before_invoke hook, once checks and argument conversion are done.
+            ctx.check_span = tracing.start_span('command.checks', 'checks and argument conversion')
+            try:
+                await super().invoke(ctx)
+            finally:
+                await self._finish_check_span(ctx)
+
+    async def start(self, *args, **kwargs):
+        self.session = create_session(self.http_metrics, limit=config.HTTP_LIMIT,
+                                      limit_per_host=config.HTTP_LIMIT_PER_HOST, dns_ttl=config.HTTP_DNS_TTL,
+                                      keepalive_timeout=config.HTTP_KEEPALIVE)
+        self.loop_monitor = LoopMonitor(self.loop, interval=config.LOOP_MONITOR_INTERVAL,
+                                        detect_slow=config.LOOP_DEBUG,
+                                        slow_threshold=config.SLOW_CALLBACK_MS / 1000)
+        self.loop_monitor.start()
+        await super().start(*args, **kwargs)
+
+    async def close(self):
+        if self.loop_monitor is not None:
+            self.loop_monitor.stop()
+        await super().close()
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
     async def get_context(self, message, *, cls=CustomContext):
         return await super().get_context(message, cls=cls)
 
 
 intents = discord.Intents(
     guilds=True, members=True, messages=True, reactions=True,
-    bans=False, emojis=True, integrations=False, webhooks=False, invites=False, voice_states=False, presences=True,
+    bans=False, emojis=True, integrations=False, webhooks=False, invites=False, voice_states=False,
+    presences=not config.LEAN_MODE,
     typing=False
 )
 
 description = 'Small bot made for Play-by-Post Dungeons & Dragons.\n' \
               'Written by Dr Turtle#1771'
 
-bot = FrogBot(desc=description, intents=intents,
-              allowed_mentions=discord.AllowedMentions.none())
-
-log_formatter = logging.Formatter('%(levelname)s | %(name)s: %(message)s')
-handler = logging.StreamHandler(sys.stdout)
-handler.setFormatter(log_formatter)
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-logger.addHandler(handler)
+# Created by main(). Image worker processes import this module again, and must not build a bot of their own.
+bot = None
+log_listener = None
 log = logging.getLogger('bot')
 
-# Make discord logs a bit quieter
-logging.getLogger('discord.gateway').setLevel(logging.WARNING)
-logging.getLogger('discord.client').setLevel(logging.WARNING)
-
 
-@bot.event
 async def on_ready():
 
     bot.ready_time = datetime.datetime.utcnow()
@@ -132,19 +205,44 @@ async def on_ready():
                     f'Loaded {len(bot.muted)} muted users.\n' \
                     f'---------------------------------------------------'
     log.info(ready_message)
+    # After a reconnect. On first start db_update replays once settings are loaded.
+    if bot.settings_loaded:
+        replay_buffered()
+
+
+def replay_buffered():
+    pending = len(bot.ready_buffer.messages)
+    for message in bot.ready_buffer.drain():
+        bot.loop.create_task(process_message(message))
+    if pending:
+        stats = bot.ready_buffer.stats()
+        log.info(f'Replaying messages received before ready: {stats["replayed"]} replayed, '
+                 f'{stats["dropped_stale"]} stale, {stats["dropped_overflow"]} overflowed so far.')
 
 
 @tasks.loop(seconds=5, count=1)
 async def db_update():
-    result = await bot.mdb['bot_settings'].find_one({'setting': 'personal_server'})
-    if result is not None:
-        for key in ['server_id', 'sheet_channel', 'general_channel']:
-            bot.personal_server[key] = result.get(key, None)
-
-    log.info('Updating Status and Muted from DB')
-    new_status = await bot.update_status_from_db()
-    await bot.change_presence(activity=new_status)
-    await bot.update_muted_from_db()
+    try:
+        result = await bot.mdb['bot_settings'].find_one({'setting': 'personal_server'})
+        if result is not None:
+            for key in ['server_id', 'sheet_channel', 'general_channel']:
+                bot.personal_server[key] = result.get(key, None)
+
+        log.info('Updating Status and Muted from DB')
+        new_status = await bot.update_status_from_db()
+        await bot.change_presence(activity=new_status)
+        await bot.update_muted_from_db()
+        if config.MONGO_STATS_LOG_SECONDS > 0:
+            mongo_stats_log.start()
+        if config.RATELIMIT_SNAPSHOT_SECONDS > 0:
+            await bot.ratelimits.load(bot.mdb['rate_limits'])
+            ratelimit_snapshot.start()
+    except Exception:
+        # Still mark settings loaded, or every message would be held in the ready buffer until restart.
+        log.exception('Loading settings from the DB failed, continuing with defaults.')
+    finally:
+        bot.settings_loaded = True
+        replay_buffered()
 
 
 @db_update.before_loop
@@ -152,14 +250,48 @@ async def before_db_update():
     await bot.wait_until_ready()
 
 
-@bot.event
+@tasks.loop(seconds=max(config.RATELIMIT_SNAPSHOT_SECONDS, 1))
+async def ratelimit_snapshot():
+    await bot.ratelimits.save(bot.mdb['rate_limits'])
+
+
+@ratelimit_snapshot.before_loop
+async def before_ratelimit_snapshot():
+    # Don't overwrite the restored snapshot straight away.
+    await asyncio.sleep(config.RATELIMIT_SNAPSHOT_SECONDS)
+
+
+@tasks.loop(seconds=max(config.MONGO_STATS_LOG_SECONDS, 1))
+async def mongo_stats_log():
+    rows = bot.mongo_metrics.summary()[:5]
+    if not rows:
+        return
+    lines = [f'{collection}.{command}: {stats["count"]} calls, {stats["errors"]} errors, '
+             f'p50 {stats["p50"]:.1f} ms, p99 {stats["p99"]:.1f} ms' for (collection, command), stats in rows]
+    checkout = bot.mongo_metrics.checkout_summary()
+    lines.append(f'Pool checkout: p50 {checkout["p50"]:.1f} ms, p99 {checkout["p99"]:.1f} ms, '
+                 f'{checkout["failures"]} failures')
+    log.info('Mongo command summary:\n' + '\n'.join(lines))
+
+
+@mongo_stats_log.before_loop
+async def before_mongo_stats_log():
+    await asyncio.sleep(config.MONGO_STATS_LOG_SECONDS)
+
+
 async def on_message(message):
     if message.author.bot:
         return
 
-    if not bot.is_ready():
+    # Muted users and the personal server aren't known until settings are loaded, so hold messages until then.
+    if not bot.is_ready() or not bot.settings_loaded:
+        bot.ready_buffer.add(message)
         return
 
+    await process_message(message)
+
+
+async def process_message(message):
     if message.author.id in bot.muted:
         return
 
@@ -171,7 +303,6 @@ async def on_message(message):
             await bot.cogs['CustomCommands'].run_custom_commands(context)
 
 
-@bot.event
 async def on_command(ctx):
     if ctx.command.name in ['py', 'pyi', 'sh']:
         return
@@ -179,7 +310,12 @@ async def on_command(ctx):
     await try_delete(ctx.message)
 
 
-@bot.event
+async def on_command_completion(ctx):
+    latency = (datetime.datetime.utcnow() - ctx.message.created_at).total_seconds()
+    log.debug(f'Command {ctx.command.qualified_name} completed in {latency:.3f}s',
+              extra={'guild_id': ctx.guild_id, 'command': ctx.command.qualified_name, 'latency': latency})
+
+
 async def on_guild_join(joined):
     # Check to make sure we aren't approaching
     if len(bot.guilds) > 90:
@@ -188,13 +324,30 @@ async def on_guild_join(joined):
         await joined.leave()
 
 
-for cog in COGS:
-    bot.load_extension(cog)
+def create_bot() -> FrogBot:
+    # Members are resolved on demand through bot.members rather than chunking every guild at startup.
+    new_bot = FrogBot(desc=description, intents=intents, chunk_guilds_at_startup=False,
+                      allowed_mentions=discord.AllowedMentions.none())
+    for handler in (on_ready, on_message, on_command, on_command_completion, on_guild_join):
+        new_bot.event(handler)
+    return new_bot
 
-if __name__ == '__main__':
+
+def main():
+    global bot, log_listener
+    log_listener = setup_logging(config.LOG_LEVEL, json_format=config.LOG_JSON,
+                                 levels=parse_levels(config.LOG_LEVELS))
+    bot = create_bot()
+    bot.lazy_cogs.load_all(COGS)
 
     if config.SENTRY_URL is not None:
-        bot.sentry = sentry_sdk.init(config.SENTRY_URL, traces_sample_rate=1)
+        sampler = tracing.make_sampler(tracing.parse_rates(config.SENTRY_TRACE_RATES))
+        bot.sentry = sentry_sdk.init(config.SENTRY_URL, traces_sampler=sampler)
+        tracing.enabled = True
 
     db_update.start()
     bot.run(config.TOKEN)
+
+
+if __name__ == '__main__':
+    main()
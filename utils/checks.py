@@ -4,6 +4,7 @@ import bot_config as config
 from utils.errors import UnauthorizedServer, IsNotDM
 from utils.constants import DMS
 
+
 def _is_owner_check(author_id):
     return author_id == config.DEV_ID
 
@@ -55,3 +56,20 @@ def able_to_ban(allowed_roles):
             return True
         raise commands.BadArgument('You are not authorized to run this command!')
     return commands.check(predicate)
+
+
+def rate_limited(policy_name):
+    """
+    Limits a command using the named policy of the bot's shared rate limiter. The bot owner is exempt.
+
+    The token is taken in a before-invoke hook rather than a check, so help listing the command doesn't use it up.
+    """
+    async def hook(*args):
+        # Called with (cog, ctx) for commands in a cog.
+        ctx = args[-1]
+        if _is_owner_check(ctx.author.id):
+            return
+        retry_after = ctx.bot.ratelimits.update(policy_name, ctx.author.id)
+        if retry_after:
+            raise commands.CommandOnCooldown(ctx.bot.ratelimits.policies[policy_name], retry_after)
+    return commands.before_invoke(hook)
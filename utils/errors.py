@@ -16,3 +16,7 @@ class IsNotDM(Exception):
 
 class APIError(Exception):
     pass
+
+
+class QueueFull(Exception):
+    pass
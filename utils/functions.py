@@ -1,6 +1,11 @@
+import os
+
 import discord
 from datetime import datetime
 
+# The repository root, for turning absolute file paths into project-relative ones.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
 
 async def try_delete(message):
     try:
@@ -37,10 +42,3 @@ def get_positivity(string):
         return False
     else:
         return None
-
-
-def member_in_guild(member_id, guild: discord.Guild) -> bool:
-    for member in guild.members:
-        if member.id == member_id:
-            return True
-    return False
@@ -0,0 +1,74 @@
+import collections
+import time
+
+# Intent that causes Discord to send each gateway event, for events FrogBot receives.
+EVENT_INTENTS = {
+    'PRESENCE_UPDATE': 'presences',
+    'GUILD_MEMBER_ADD': 'members',
+    'GUILD_MEMBER_UPDATE': 'members',
+    'GUILD_MEMBER_REMOVE': 'members',
+    'GUILD_MEMBERS_CHUNK': 'members',
+    'MESSAGE_REACTION_ADD': 'reactions',
+    'MESSAGE_REACTION_REMOVE': 'reactions',
+    'MESSAGE_REACTION_REMOVE_ALL': 'reactions',
+    'MESSAGE_REACTION_REMOVE_EMOJI': 'reactions',
+    'MESSAGE_CREATE': 'messages',
+    'MESSAGE_UPDATE': 'messages',
+    'MESSAGE_DELETE': 'messages',
+    'MESSAGE_DELETE_BULK': 'messages',
+    'TYPING_START': 'typing',
+    'GUILD_EMOJIS_UPDATE': 'emojis',
+    'VOICE_STATE_UPDATE': 'voice_states',
+}
+
+
+class GatewayStats:
+    """
+    Counts raw gateway dispatches by event type (and optionally by guild).
+
+    Totals are sampled into a ring buffer every `interval` seconds, so rates can be computed over recent windows.
+    """
+
+    def __init__(self, track_guilds: bool = False, history: int = 60):
+        self.track_guilds = track_guilds
+        self.events = collections.Counter()
+        self.guilds = collections.Counter()
+        self.samples = collections.deque(maxlen=history)
+        self.started = time.monotonic()
+
+    def record(self, msg: dict):
+        event = msg.get('t')
+        if event is None:
+            return
+        self.events[event] += 1
+        if self.track_guilds:
+            data = msg.get('d')
+            if isinstance(data, dict) and (guild_id := data.get('guild_id')) is not None:
+                self.guilds[guild_id] += 1
+
+    def sample(self):
+        self.samples.append((time.monotonic(), sum(self.events.values()), self.events.copy()))
+
+    def rate(self) -> float:
+        """
+        Events per second over the sampled history, or since startup if there are too few samples.
+        """
+        if len(self.samples) < 2:
+            elapsed = time.monotonic() - self.started
+            return sum(self.events.values()) / elapsed if elapsed else 0.0
+        (first_time, first_total, _), (last_time, last_total, _) = self.samples[0], self.samples[-1]
+        return (last_total - first_total) / (last_time - first_time)
+
+    def recent_events(self) -> collections.Counter:
+        """
+        Event counts within the sampled history.
+        """
+        if len(self.samples) < 2:
+            return self.events.copy()
+        return self.samples[-1][2] - self.samples[0][2]
+
+    def by_intent(self) -> collections.Counter:
+        intents = collections.Counter()
+        for event, count in self.recent_events().items():
+            intents[EVENT_INTENTS.get(event, 'guilds')] += count
+        return intents
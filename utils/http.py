@@ -0,0 +1,66 @@
+import collections
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class HostStats:
+    __slots__ = ('requests', 'errors', 'total_time', 'max_time')
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+
+    @property
+    def avg_time(self) -> float:
+        return self.total_time / self.requests if self.requests else 0.0
+
+
+class HTTPMetrics:
+    """
+    Collects per-host request counts and latency for a `aiohttp.ClientSession`, via a `aiohttp.TraceConfig`.
+    """
+
+    def __init__(self):
+        self.hosts = collections.defaultdict(HostStats)
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(self._on_request_start)
+        trace_config.on_request_end.append(self._on_request_end)
+        trace_config.on_request_exception.append(self._on_request_exception)
+        return trace_config
+
+    def _finish(self, context, url, error: bool):
+        stats = self.hosts[urlsplit(str(url)).hostname or 'unknown']
+        elapsed = time.monotonic() - context.start
+        stats.requests += 1
+        stats.errors += error
+        stats.total_time += elapsed
+        stats.max_time = max(stats.max_time, elapsed)
+
+    async def _on_request_start(self, session, context, params):
+        context.start = time.monotonic()
+
+    async def _on_request_end(self, session, context, params):
+        self._finish(context, params.url, error=params.response.status >= 400)
+
+    async def _on_request_exception(self, session, context, params):
+        self._finish(context, params.url, error=True)
+
+    def top_hosts(self, count: int = 5) -> list:
+        return sorted(self.hosts.items(), key=lambda item: item[1].requests, reverse=True)[:count]
+
+
+def create_session(metrics: HTTPMetrics, limit: int = 100, limit_per_host: int = 10,
+                   dns_ttl: int = 300, keepalive_timeout: float = 30, timeout: float = 30) -> aiohttp.ClientSession:
+    """
+    Creates the bot-wide `aiohttp.ClientSession`. Must be called from inside the running event loop.
+    """
+    connector = aiohttp.TCPConnector(limit=limit, limit_per_host=limit_per_host, ttl_dns_cache=dns_ttl,
+                                     keepalive_timeout=keepalive_timeout)
+    return aiohttp.ClientSession(connector=connector, trace_configs=[metrics.trace_config()],
+                                 timeout=aiohttp.ClientTimeout(total=timeout))
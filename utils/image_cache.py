@@ -0,0 +1,242 @@
+import asyncio
+import collections
+import hashlib
+import logging
+import os
+import time
+
+log = logging.getLogger(__name__)
+
+
+def content_key(filter_name: str, data: bytes) -> str:
+    return f'{filter_name}:{hashlib.sha256(data).hexdigest()}'
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _write_file(path: str, data: bytes):
+    # Written under a temporary name and renamed, so a crash never leaves a truncated entry behind.
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except OSError:
+        _remove_files([temp_path])
+        raise
+
+
+def _scan_dir(disk_dir: str) -> list:
+    """
+    :return: List of (path, size) for the cached entries in `disk_dir`, least recently written first.
+    """
+    os.makedirs(disk_dir, exist_ok=True)
+    entries = []
+    leftovers = []
+    for name in os.listdir(disk_dir):
+        path = os.path.join(disk_dir, name)
+        if name.endswith('.tmp'):
+            leftovers.append(path)
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, path, stat.st_size))
+    _remove_files(leftovers)
+    return [(path, size) for _, path, size in sorted(entries)]
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class ImageCache:
+    """
+    Caches generated images by (filter, source content hash), in an LRU with a byte budget.
+
+    Entries evicted from memory spill to `disk_dir` if one is given, which has its own byte budget.
+    Disk reads and writes run in the default executor, so they don't block the event loop, and the existing
+    entries are indexed the first time the disk is used.
+    Source URLs are remembered as aliases of the content key, so repeat requests can skip the download too.
+    """
+
+    def __init__(self, max_bytes: int, disk_dir: str = None, max_disk_bytes: int = 0,
+                 max_aliases: int = 4096, alias_ttl: float = 3600):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_aliases = max_aliases
+        self.alias_ttl = alias_ttl
+
+        self._memory = collections.OrderedDict()
+        self._memory_bytes = 0
+        self._disk = collections.OrderedDict()
+        self._disk_bytes = 0
+        self._writing = set()
+        self._disk_indexed = False
+        self._index_lock = asyncio.Lock()
+        self._aliases = collections.OrderedDict()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    # ---- Aliases ----
+    def resolve(self, filter_name: str, url: str):
+        """
+        Returns the content key last produced for `url` with this filter, or None.
+        """
+        alias = f'{filter_name}:{url}'
+        entry = self._aliases.get(alias)
+        if entry is None:
+            return None
+        key, added = entry
+        if time.monotonic() - added > self.alias_ttl:
+            del self._aliases[alias]
+            return None
+        self._aliases.move_to_end(alias)
+        return key
+
+    def alias(self, filter_name: str, url: str, key: str):
+        alias = f'{filter_name}:{url}'
+        self._aliases[alias] = (key, time.monotonic())
+        self._aliases.move_to_end(alias)
+        while len(self._aliases) > self.max_aliases:
+            self._aliases.popitem(last=False)
+
+    # ---- Entries ----
+    async def get(self, key: str):
+        if key is None:
+            return None
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return data
+        data = await self._read_disk(key)
+        if data is not None:
+            self.disk_hits += 1
+            await self._store(key, data)
+            return data
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        await self._store(key, data)
+
+    async def _store(self, key: str, data: bytes):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old)
+        self._memory[key] = data
+        self._memory_bytes += len(data)
+        evicted = []
+        while self._memory_bytes > self.max_bytes:
+            evicted_key, evicted_data = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted_data)
+            evicted.append((evicted_key, evicted_data))
+        for evicted_key, evicted_data in evicted:
+            await self._write_disk(evicted_key, evicted_data)
+
+    # ---- Disk ----
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, hashlib.sha256(key.encode()).hexdigest() + '.png')
+
+    async def _load_disk_index(self):
+        async with self._index_lock:
+            if self._disk_indexed:
+                return
+            loop = asyncio.get_running_loop()
+            try:
+                entries = await loop.run_in_executor(None, _scan_dir, self.disk_dir)
+            except OSError as e:
+                log.warning(f'Could not read the image cache directory, caching in memory only: {e}')
+                self.disk_dir = None
+                return
+            for path, size in entries:
+                self._disk[path] = size
+                self._disk_bytes += size
+            # The budget may have been lowered since these were written.
+            evicted = self._evict_disk()
+            if evicted:
+                await loop.run_in_executor(None, _remove_files, evicted)
+            self._disk_indexed = True
+
+    def _evict_disk(self) -> list:
+        evicted = []
+        while self._disk_bytes > self.max_disk_bytes:
+            evicted_path, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            evicted.append(evicted_path)
+        return evicted
+
+    async def _read_disk(self, key: str):
+        if self.disk_dir is None:
+            return None
+        if not self._disk_indexed:
+            await self._load_disk_index()
+            if self.disk_dir is None:
+                return None
+        path = self._path(key)
+        if path not in self._disk:
+            return None
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, _read_file, path)
+        except OSError:
+            # Evicted while it was being read, or removed from outside the bot.
+            if path in self._disk:
+                self._disk_bytes -= self._disk.pop(path)
+            return None
+        if path in self._disk:
+            self._disk.move_to_end(path)
+        return data
+
+    async def _write_disk(self, key: str, data: bytes):
+        if self.disk_dir is None or len(data) > self.max_disk_bytes:
+            return
+        if not self._disk_indexed:
+            await self._load_disk_index()
+            if self.disk_dir is None:
+                return
+        path = self._path(key)
+        if path in self._disk:
+            self._disk.move_to_end(path)
+            return
+        if path in self._writing:
+            return
+        loop = asyncio.get_running_loop()
+        # Only added to the index once written, so a read never sees a partial file.
+        self._writing.add(path)
+        try:
+            await loop.run_in_executor(None, _write_file, path, data)
+        except OSError as e:
+            log.warning(f'Could not write image cache entry: {e}')
+            return
+        finally:
+            self._writing.discard(path)
+        self._disk[path] = len(data)
+        self._disk_bytes += len(data)
+        evicted = self._evict_disk()
+        if evicted:
+            await loop.run_in_executor(None, _remove_files, evicted)
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self._memory),
+            'memory_bytes': self._memory_bytes,
+            'disk_entries': len(self._disk),
+            'disk_bytes': self._disk_bytes,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses
+        }
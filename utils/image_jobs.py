@@ -0,0 +1,166 @@
+import asyncio
+import collections
+import logging
+import logging.handlers
+import multiprocessing
+import time
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from utils.errors import APIError, QueueFull
+from utils.logs import ForwardHandler, setup_worker_logging
+
+log = logging.getLogger(__name__)
+
+
+class ImageJobQueue:
+    """
+    Runs CPU-bound image jobs in a bounded process pool, fed from an asyncio queue.
+
+    Jobs are rejected with `QueueFull` instead of waiting when the queue, or the user's share of it, is full.
+    Workers are spawned rather than forked, since the bot has threads running that a fork would copy mid-state,
+    and their log records are sent back to this process. If a worker dies the pool is replaced.
+    """
+
+    def __init__(self, loop, workers: int = 2, max_queued: int = 20, max_per_user: int = 2):
+        self.loop = loop
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self._mp_context = multiprocessing.get_context('spawn')
+        # Started with the first job, see `_get_executor`.
+        self._log_manager = None
+        self._log_queue = None
+        self._log_listener = None
+        self._executor = None
+        self._starting = asyncio.Lock()
+        self.restarts = 0
+        self._queue = asyncio.Queue(maxsize=max_queued)
+        self._per_user = collections.Counter()
+        self._workers = [loop.create_task(self._worker()) for _ in range(workers)]
+
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_depth = 0
+        self._wait_time = 0.0
+        self._job_time = 0.0
+        self.max_job_time = 0.0
+
+    def _start_logging(self):
+        # A manager queue, as a worker killed while writing to a plain multiprocessing queue can leave its lock held.
+        self._log_manager = self._mp_context.Manager()
+        self._log_queue = self._log_manager.Queue()
+        self._log_listener = logging.handlers.QueueListener(self._log_queue, ForwardHandler())
+        self._log_listener.start()
+
+    async def _get_executor(self) -> ProcessPoolExecutor:
+        async with self._starting:
+            if self._executor is None:
+                # Starting the manager's server process blocks for a few hundred milliseconds, so not on the loop.
+                await self.loop.run_in_executor(None, self._start_logging)
+                self._executor = self._create_executor()
+        return self._executor
+
+    def _create_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._mp_context,
+                                   initializer=setup_worker_logging,
+                                   initargs=(self._log_queue, logging.getLogger().getEffectiveLevel()))
+
+    def _restart_executor(self, broken: ProcessPoolExecutor):
+        # Every job running in a broken pool fails at once, only the first to notice replaces it.
+        if self._executor is not broken:
+            return
+        log.warning('An image worker process died, restarting the pool.')
+        self.restarts += 1
+        broken.shutdown(wait=False)
+        self._executor = self._create_executor()
+
+    def reserve(self, user_id: int):
+        """
+        Counts a pending image request against the user's share of the queue. Call `release` once it finishes.
+
+        :raises QueueFull: If the user already has `max_per_user` requests pending.
+        """
+        if self._per_user[user_id] >= self.max_per_user:
+            self.rejected += 1
+            raise QueueFull('You already have images being processed, wait for them to finish.')
+        self._per_user[user_id] += 1
+
+    def release(self, user_id: int):
+        self._per_user[user_id] -= 1
+        if self._per_user[user_id] <= 0:
+            del self._per_user[user_id]
+
+    async def submit(self, func, *args):
+        """
+        Queues `func(*args)` to run in the process pool and waits for its result.
+
+        Per-user limits are not checked here, requests are counted with `reserve` before they get this far.
+
+        :raises QueueFull: If the queue is full.
+        """
+        future = self.loop.create_future()
+        try:
+            self._queue.put_nowait((future, func, args, time.monotonic()))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFull('I am busy processing other images right now, try again in a bit.')
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return await future
+
+    async def _worker(self):
+        while True:
+            future, func, args, queued_at = await self._queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                start = time.monotonic()
+                self._wait_time += start - queued_at
+                try:
+                    executor = await self._get_executor()
+                    result = await self.loop.run_in_executor(executor, func, *args)
+                except BrokenExecutor:
+                    self.failed += 1
+                    self._restart_executor(executor)
+                    if not future.done():
+                        future.set_exception(APIError('The image worker crashed while processing that image.'))
+                except Exception as e:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    self.completed += 1
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    elapsed = time.monotonic() - start
+                    self._job_time += elapsed
+                    self.max_job_time = max(self.max_job_time, elapsed)
+            finally:
+                self._queue.task_done()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def metrics(self) -> dict:
+        finished = self.completed + self.failed
+        return {
+            'depth': self.depth,
+            'max_depth': self.max_depth,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'restarts': self.restarts,
+            'avg_wait': self._wait_time / finished if finished else 0.0,
+            'avg_job_time': self._job_time / finished if finished else 0.0,
+            'max_job_time': self.max_job_time
+        }
+
+    def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._log_manager is not None:
+            self._log_listener.stop()
+            self._log_manager.shutdown()
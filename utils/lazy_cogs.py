@@ -0,0 +1,140 @@
+"""
+Extension loading with startup timing, and deferred loading for rarely used extensions.
+
+A deferred extension is not imported at startup. Instead, a placeholder cog with a stub for each of its top-level
+commands is added, so help and dispatch still find them. The first time a stub is invoked, the placeholder is
+removed, the real extension is loaded and the message is dispatched again.
+"""
+import logging
+import time
+
+from discord.ext import commands
+
+log = logging.getLogger(__name__)
+
+# Top-level commands of each deferrable extension: cog name, then (name, aliases, help, hidden) per command.
+# Keep these in sync with the extensions, a command missing here can't be used until the extension is loaded.
+# Drift is logged as a warning when a deferred extension loads.
+MANIFEST = {
+    'jishaku': ('Jishaku', (
+        ('jishaku', ('jsk',), 'The Jishaku debug and diagnostic commands.', True),
+    )),
+    'cogs.images': ('Images', (
+        ('imagestats', (), 'Shows the state of the image processing queue.', True),
+        ('invert', (), 'Inverts the colors for a given URL.', False),
+        ('wasted', (), 'Overlays the image with "wasted" from GTA.', False),
+        ('greyscale', ('grayscale',), 'Converts the image at a given URL to greyscale.', False),
+        ('blur', (), 'Blurs the image at a given URL.', False),
+        ('sepia', (), 'Applies a sepia tone to the image at a given URL.', False),
+        ('pixelate', (), 'Pixelates the image at a given URL.', False),
+    )),
+    'cogs.quest_roles': ('QuestRoles', (
+        ('questrole', (), 'Creates a Role for Quests', False),
+    )),
+}
+
+
+def parse_extensions(raw: str) -> set:
+    return {name.strip() for name in raw.split(',') if name.strip()}
+
+
+def _stub_cog(extension: str, cog_name: str, entries):
+    attrs = {}
+    for name, aliases, help_text, hidden in entries:
+        async def stub(self, ctx):
+            new_ctx = await ctx.bot.lazy_cogs.load_for(ctx)
+            await ctx.bot.invoke(new_ctx)
+
+        attrs[f'_stub_{name}'] = commands.command(name=name, aliases=list(aliases), help=help_text,
+                                                  hidden=hidden)(stub)
+    attrs['extension'] = extension
+    return type(f'Deferred{cog_name}', (commands.Cog,), attrs, name=cog_name)
+
+
+class LazyExtensions:
+    """
+    Loads extensions, timing each one, and defers those listed in `deferred` that have a manifest entry.
+
+    `load_times` holds the time each loaded extension took in seconds, including ones loaded later on demand.
+    """
+
+    def __init__(self, bot, deferred=()):
+        self.bot = bot
+        self.deferred = {name for name in deferred if name in MANIFEST}
+        self.pending = {}
+        self.load_times = {}
+        for name in set(deferred) - self.deferred:
+            log.warning(f'Extension {name} has no command manifest and will be loaded at startup.')
+
+    def _load(self, extension: str):
+        start = time.perf_counter()
+        self.bot.load_extension(extension)
+        self.load_times[extension] = time.perf_counter() - start
+
+    def load_all(self, extensions):
+        start = time.perf_counter()
+        for extension in extensions:
+            if extension in self.deferred:
+                cog_name, entries = MANIFEST[extension]
+                cog = _stub_cog(extension, cog_name, entries)()
+                self.bot.add_cog(cog)
+                self.pending[extension] = cog
+                continue
+            self._load(extension)
+        total = time.perf_counter() - start
+        lines = [f'{name}: {elapsed * 1000:.0f} ms' for name, elapsed in
+                 sorted(self.load_times.items(), key=lambda item: item[1], reverse=True)]
+        if self.pending:
+            lines.append(f'Deferred: {", ".join(self.pending)}')
+        log.info(f'Loaded {len(self.load_times)} extensions in {total * 1000:.0f} ms\n' + '\n'.join(lines))
+
+    def is_stub(self, command) -> bool:
+        return command.cog is not None and command.cog in self.pending.values()
+
+    def load(self, extension: str):
+        """
+        Replaces the placeholder for a deferred extension with the real one. Does nothing if it is already loaded.
+        """
+        cog = self.pending.pop(extension, None)
+        if cog is None:
+            return
+        self.bot.remove_cog(cog.qualified_name)
+        try:
+            self._load(extension)
+        except Exception:
+            self.bot.add_cog(cog)
+            self.pending[extension] = cog
+            raise
+        log.info(f'Loaded deferred extension {extension} in {self.load_times[extension] * 1000:.0f} ms')
+        self.check_manifest(extension)
+
+    def check_manifest(self, extension: str):
+        """
+        Warns if the top-level commands of a loaded extension don't match its manifest entry.
+        """
+        cog_name, entries = MANIFEST[extension]
+        cog = self.bot.get_cog(cog_name)
+        if cog is None:
+            log.warning(f'Extension {extension} did not add the cog {cog_name} named in its manifest.')
+            return
+        expected = {name: set(aliases) for name, aliases, _, _ in entries}
+        actual = {command.name: set(command.aliases) for command in cog.get_commands()}
+        problems = []
+        missing = sorted(actual.keys() - expected.keys())
+        if missing:
+            problems.append(f'missing {", ".join(missing)}')
+        extra = sorted(expected.keys() - actual.keys())
+        if extra:
+            problems.append(f'no longer has {", ".join(extra)}')
+        changed = sorted(name for name in expected.keys() & actual.keys() if expected[name] != actual[name])
+        if changed:
+            problems.append(f'different aliases for {", ".join(changed)}')
+        if problems:
+            log.warning(f'Command manifest for {extension} is out of date: {"; ".join(problems)}.')
+
+    async def load_for(self, ctx):
+        """
+        Loads the extension behind a stub command, and returns a new context for the message that invoked it.
+        """
+        self.load(ctx.command.cog.extension)
+        return await self.bot.get_context(ctx.message)
@@ -0,0 +1,91 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+
+# Extra fields that are added to JSON logs when passed with `extra=`.
+CONTEXT_FIELDS = ('guild_id', 'command', 'latency')
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        data = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info:
+            data['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+def parse_levels(raw: str) -> dict:
+    """
+    Parses logger levels in the form `logger=LEVEL,logger=LEVEL`, e.g. `discord.gateway=WARNING`.
+    """
+    levels = {}
+    for item in filter(None, (part.strip() for part in raw.split(','))):
+        name, _, level = item.partition('=')
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging(level: str = 'INFO', json_format: bool = False,
+                  levels: dict = None) -> logging.handlers.QueueListener:
+    """
+    Routes all logging through a queue, so the event loop never blocks writing to stdout.
+
+    Records are formatted and written by a `QueueListener` on a background thread, which is stopped
+    (flushing anything still queued) at exit.
+    """
+    if json_format:
+        formatter = JSONFormatter()
+    else:
+        formatter = logging.Formatter('%(levelname)s | %(name)s: %(message)s')
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(-1)
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+
+    logger = logging.getLogger()
+    logger.setLevel(level.upper())
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    for name, logger_level in (levels or {}).items():
+        logging.getLogger(name).setLevel(logger_level)
+
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+class ForwardHandler(logging.Handler):
+    """
+    Passes records from another process to the logger of the same name in this one.
+    """
+
+    def handle(self, record):
+        logger = logging.getLogger(record.name)
+        if logger.isEnabledFor(record.levelno):
+            logger.handle(record)
+        return True
+
+    def emit(self, record):
+        pass
+
+
+def setup_worker_logging(log_queue, level: int):
+    """
+    Process pool initializer that sends every record from the worker back to the parent through `log_queue`.
+    """
+    logger = logging.getLogger()
+    logger.handlers.clear()
+    logger.setLevel(level)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
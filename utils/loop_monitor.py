@@ -0,0 +1,109 @@
+import asyncio
+import bisect
+import collections
+import logging
+import sys
+import threading
+import time
+import traceback
+
+log = logging.getLogger(__name__)
+
+# Upper bounds (in ms) of the lag histogram buckets, the last bucket catches everything above.
+LAG_BUCKETS = (1, 5, 10, 50, 100, 500, 1000)
+
+SlowCallback = collections.namedtuple('SlowCallback', ['when', 'duration', 'task', 'stack'])
+
+
+class LoopMonitor:
+    """
+    Measures how late the event loop runs a sleep that should wake every `interval` seconds.
+
+    With `detect_slow` set, a watchdog thread also samples the loop thread's stack whenever the loop has not
+    checked in for `slow_threshold` seconds, and logs the task that was running at the time.
+    """
+
+    def __init__(self, loop, interval: float = 0.5, detect_slow: bool = False, slow_threshold: float = 0.25,
+                 keep_slow: int = 20):
+        self.loop = loop
+        self.interval = interval
+        self.detect_slow = detect_slow
+        self.slow_threshold = slow_threshold
+
+        self.histogram = [0] * (len(LAG_BUCKETS) + 1)
+        self.samples = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.slow_callbacks = collections.deque(maxlen=keep_slow)
+
+        self._heartbeat = time.monotonic()
+        self._loop_thread = None
+        self._task = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._loop_thread = threading.get_ident()
+        self._task = self.loop.create_task(self._measure())
+        if self.detect_slow:
+            self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+
+    async def _measure(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._heartbeat = now
+            self.record((now - expected) * 1000)
+
+    def record(self, lag_ms: float):
+        lag_ms = max(lag_ms, 0.0)
+        self.last_lag = lag_ms
+        self.max_lag = max(self.max_lag, lag_ms)
+        self.samples += 1
+        self.histogram[bisect.bisect_left(LAG_BUCKETS, lag_ms)] += 1
+
+    def percentile(self, percent: float) -> float:
+        """
+        Estimates a lag percentile (in ms) from the histogram, as the upper bound of the bucket it falls in.
+        """
+        if not self.samples:
+            return 0.0
+        target = self.samples * percent / 100
+        seen = 0
+        for index, count in enumerate(self.histogram):
+            seen += count
+            if seen >= target:
+                return min(LAG_BUCKETS[index], self.max_lag) if index < len(LAG_BUCKETS) else self.max_lag
+        return self.max_lag
+
+    # ---- Slow callback detection ----
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.slow_threshold / 2):
+            heartbeat = self._heartbeat
+            blocked = time.monotonic() - heartbeat - self.interval
+            if blocked < self.slow_threshold or reported == heartbeat:
+                continue
+            reported = heartbeat
+            self._report(blocked)
+
+    def _report(self, blocked: float):
+        frame = sys._current_frames().get(self._loop_thread)
+        stack = ''.join(traceback.format_stack(frame, limit=15)) if frame is not None else ''
+        task = None
+        try:
+            current = asyncio.current_task(self.loop)
+        except RuntimeError:
+            current = None
+        if current is not None:
+            coro = current.get_coro()
+            task = getattr(coro, '__qualname__', repr(coro))
+        self.slow_callbacks.append(SlowCallback(time.time(), blocked, task, stack))
+        log.warning(f'Event loop blocked for at least {blocked * 1000:.0f} ms in {task or "a callback"}:\n{stack}')
@@ -0,0 +1,130 @@
+import asyncio
+import collections
+import logging
+import time
+
+log = logging.getLogger(__name__)
+
+# Most user IDs Discord accepts in one member query.
+QUERY_LIMIT = 100
+
+
+class _Batch:
+    __slots__ = ('ids', 'future')
+
+    def __init__(self, future):
+        self.ids = set()
+        self.future = future
+
+
+class MemberResolver:
+    """
+    Looks up guild members by ID without the full member list being chunked at startup.
+
+    Members already in discord.py's cache are returned straight away. The rest are requested over the gateway,
+    with lookups for the same guild made within `batch_delay` seconds sent as one query. Results are kept in an
+    LRU cache of at most `max_size` members, each for up to `ttl` seconds since cached members aren't updated.
+    IDs that aren't in the guild are remembered for `absent_ttl` seconds, so repeated lookups don't each cost
+    a gateway request. If a query fails, the members it asked for are treated as not found.
+    """
+
+    def __init__(self, loop, max_size: int = 5000, ttl: float = 600, absent_ttl: float = 60,
+                 batch_delay: float = 0.05):
+        self.loop = loop
+        self.max_size = max_size
+        self.ttl = ttl
+        self.absent_ttl = absent_ttl
+        self.batch_delay = batch_delay
+        # (guild ID, member ID) -> (member or None if absent, time cached)
+        self._cache = collections.OrderedDict()
+        self._batches = {}
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+        self.errors = 0
+
+    def _lookup(self, guild, member_id: int):
+        """
+        :return: (whether the result is known, member or None)
+        """
+        member = guild.get_member(member_id)
+        if member is not None:
+            return True, member
+        key = (guild.id, member_id)
+        entry = self._cache.get(key)
+        if entry is None:
+            return False, None
+        member, cached_at = entry
+        if time.monotonic() - cached_at > (self.ttl if member is not None else self.absent_ttl):
+            del self._cache[key]
+            return False, None
+        self._cache.move_to_end(key)
+        return True, member
+
+    def get(self, guild, member_id: int):
+        """
+        Returns the member if it is cached, without making a request.
+        """
+        return self._lookup(guild, member_id)[1]
+
+    def _store(self, guild_id: int, member_id: int, member):
+        key = (guild_id, member_id)
+        self._cache[key] = (member, time.monotonic())
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_size:
+            self._cache.popitem(last=False)
+
+    def forget(self, guild_id: int, member_id: int):
+        self._cache.pop((guild_id, member_id), None)
+
+    async def fetch(self, guild, member_id: int):
+        """
+        Returns the member with this ID, or None if they are not in the guild or the lookup failed.
+        """
+        known, member = self._lookup(guild, member_id)
+        if known:
+            self.hits += 1
+            return member
+        self.misses += 1
+        batch = self._batches.get(guild.id)
+        if batch is None or len(batch.ids) >= QUERY_LIMIT:
+            batch = self._batches[guild.id] = _Batch(self.loop.create_future())
+            self.loop.call_later(self.batch_delay, lambda: self.loop.create_task(self._flush(guild, batch)))
+        batch.ids.add(member_id)
+        # Shielded so one caller being cancelled doesn't cancel the lookup for everyone else in the batch.
+        found = await asyncio.shield(batch.future)
+        return found.get(member_id)
+
+    async def fetch_many(self, guild, member_ids) -> dict:
+        """
+        :return: Dict of member ID to member, for the members that are in the guild.
+        """
+        member_ids = list(dict.fromkeys(member_ids))
+        members = await asyncio.gather(*(self.fetch(guild, member_id) for member_id in member_ids))
+        return {member_id: member for member_id, member in zip(member_ids, members) if member is not None}
+
+    async def _flush(self, guild, batch: _Batch):
+        if self._batches.get(guild.id) is batch:
+            del self._batches[guild.id]
+        self.queries += 1
+        try:
+            members = await guild.query_members(user_ids=list(batch.ids), limit=len(batch.ids), cache=False)
+        except Exception as e:
+            # Timeouts and gateway errors: nothing is cached, so the next lookup tries again.
+            self.errors += 1
+            log.warning(f'Member query for {len(batch.ids)} members in {guild.id} failed: {e!r}')
+            batch.future.set_result({})
+            return
+        found = {member.id: member for member in members}
+        for member_id in batch.ids:
+            self._store(guild.id, member_id, found.get(member_id))
+        batch.future.set_result(found)
+
+    def stats(self) -> dict:
+        return {
+            'cached': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'queries': self.queries,
+            'errors': self.errors
+        }
@@ -0,0 +1,84 @@
+import collections
+import os
+import tracemalloc
+
+from utils.functions import ROOT
+
+# Allocations made by the profiler itself.
+IGNORED = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+)
+
+
+def take_snapshot() -> tracemalloc.Snapshot:
+    return tracemalloc.take_snapshot().filter_traces(IGNORED)
+
+
+def _module_name(filename: str):
+    if not filename.startswith(ROOT):
+        return None
+    relative = os.path.relpath(filename, ROOT)
+    return os.path.splitext(relative)[0].replace(os.sep, '.')
+
+
+def by_module(snapshot: tracemalloc.Snapshot) -> collections.Counter:
+    """
+    Sums allocated bytes per FrogBot module (e.g. `cogs.images`).
+
+    Each trace is attributed to the innermost frame in FrogBot's own code, so memory allocated inside a library on
+    behalf of a cog counts towards that cog. Traces with no FrogBot frame are grouped under `other`.
+    """
+    sizes = collections.Counter()
+    for trace in snapshot.traces:
+        module = 'other'
+        # Frames are ordered oldest call first.
+        for frame in reversed(trace.traceback):
+            name = _module_name(frame.filename)
+            if name is not None:
+                module = name
+                break
+        sizes[module] += trace.size
+    return sizes
+
+
+def format_size(size: int) -> str:
+    for unit in ('B', 'KiB', 'MiB'):
+        if abs(size) < 1024:
+            return f'{size:.1f} {unit}'
+        size /= 1024
+    return f'{size:.1f} GiB'
+
+
+def top_lines(snapshot: tracemalloc.Snapshot, limit: int = 10, modules: bool = False) -> list:
+    """
+    :return: The top allocation sites (or FrogBot modules) by size, formatted one per line.
+    """
+    if modules:
+        return [f'{format_size(size)} - {module}' for module, size in by_module(snapshot).most_common(limit)]
+    lines = []
+    for stat in snapshot.statistics('lineno')[:limit]:
+        frame = stat.traceback[0]
+        filename = os.path.relpath(frame.filename, ROOT) if frame.filename.startswith(ROOT) else frame.filename
+        lines.append(f'{format_size(stat.size)} ({stat.count} blocks) - {filename}:{frame.lineno}')
+    return lines
+
+
+def diff_lines(old: tracemalloc.Snapshot, new: tracemalloc.Snapshot, limit: int = 10, modules: bool = False) -> list:
+    """
+    :return: The allocation sites (or FrogBot modules) that grew the most between two snapshots, one per line.
+    """
+    if modules:
+        old_sizes, new_sizes = by_module(old), by_module(new)
+        changes = {module: new_sizes[module] - old_sizes[module] for module in set(old_sizes) | set(new_sizes)}
+        ordered = sorted(changes.items(), key=lambda item: abs(item[1]), reverse=True)[:limit]
+        return [f'{"+" if change >= 0 else "-"}{format_size(abs(change))} - {module}' for module, change in ordered]
+    lines = []
+    for stat in new.compare_to(old, 'lineno')[:limit]:
+        frame = stat.traceback[0]
+        filename = os.path.relpath(frame.filename, ROOT) if frame.filename.startswith(ROOT) else frame.filename
+        sign = '+' if stat.size_diff >= 0 else '-'
+        lines.append(f'{sign}{format_size(abs(stat.size_diff))} ({stat.count_diff:+} blocks) - '
+                     f'{filename}:{frame.lineno}')
+    return lines
@@ -0,0 +1,157 @@
+import collections
+import threading
+import time
+
+from pymongo import monitoring
+
+from utils import tracing
+
+# Commands whose first value is not a collection name.
+NO_COLLECTION = ('getMore', 'killCursors')
+
+
+def _percentile(values, percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+class CommandStats:
+    __slots__ = ('count', 'errors', 'total', 'recent')
+
+    def __init__(self, keep: int):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.recent = collections.deque(maxlen=keep)
+
+    def summary(self) -> dict:
+        recent = list(self.recent)
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg': self.total / self.count if self.count else 0.0,
+            'p50': _percentile(recent, 50),
+            'p95': _percentile(recent, 95),
+            'p99': _percentile(recent, 99)
+        }
+
+
+class MongoMetrics(monitoring.CommandListener, monitoring.ConnectionPoolListener):
+    """
+    Aggregates command latency per (collection, command) and connection pool checkout waits.
+
+    Register it with `event_listeners=[metrics]` when creating the client. Listener callbacks run on
+    Motor's worker threads, so all state is guarded by a lock. Latencies are in milliseconds.
+    """
+
+    def __init__(self, keep: int = 512):
+        self.keep = keep
+        self.commands = {}
+        self.checkout = CommandStats(keep)
+        self.checkout_failures = 0
+        self._pending = {}
+        self._checkout_start = threading.local()
+        self._lock = threading.Lock()
+
+    # ---- Commands ----
+    def started(self, event):
+        command = event.command_name
+        if command == 'getMore':
+            collection = event.command.get('collection', '?')
+        elif command in NO_COLLECTION:
+            collection = '?'
+        else:
+            collection = event.command.get(command)
+            if not isinstance(collection, str):
+                collection = '-'
+        span = tracing.start_span('db.mongo', f'{collection}.{command}') if tracing.enabled else None
+        with self._lock:
+            self._pending[(event.request_id, event.connection_id)] = (collection, command, span)
+
+    def _finish(self, event, failed: bool):
+        with self._lock:
+            pending = self._pending.pop((event.request_id, event.connection_id), None)
+            if pending is None:
+                return
+            collection, command, span = pending
+            if span is not None:
+                span.set_status('internal_error' if failed else 'ok')
+                span.finish()
+            key = (collection, command)
+            stats = self.commands.get(key)
+            if stats is None:
+                stats = self.commands[key] = CommandStats(self.keep)
+            elapsed = event.duration_micros / 1000
+            stats.count += 1
+            stats.errors += failed
+            stats.total += elapsed
+            stats.recent.append(elapsed)
+
+    def succeeded(self, event):
+        self._finish(event, failed=False)
+
+    def failed(self, event):
+        self._finish(event, failed=True)
+
+    # ---- Connection Pool ----
+    def connection_check_out_started(self, event):
+        self._checkout_start.value = time.monotonic()
+
+    def connection_checked_out(self, event):
+        start = getattr(self._checkout_start, 'value', None)
+        if start is None:
+            return
+        elapsed = (time.monotonic() - start) * 1000
+        with self._lock:
+            self.checkout.count += 1
+            self.checkout.total += elapsed
+            self.checkout.recent.append(elapsed)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+    # ---- Reporting ----
+    def summary(self, sort_by: str = 'total') -> list:
+        """
+        :return: List of ((collection, command), stats dict), slowest (by `sort_by`) first.
+        """
+        with self._lock:
+            rows = [(key, stats.summary(), stats.total) for key, stats in self.commands.items()]
+        if sort_by == 'total':
+            rows.sort(key=lambda row: row[2], reverse=True)
+        else:
+            rows.sort(key=lambda row: row[1][sort_by], reverse=True)
+        return [(key, stats) for key, stats, _ in rows]
+
+    def checkout_summary(self) -> dict:
+        with self._lock:
+            summary = self.checkout.summary()
+            summary['failures'] = self.checkout_failures
+        return summary
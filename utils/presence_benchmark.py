@@ -0,0 +1,86 @@
+"""
+Measures what the presence intent costs in member cache memory and GUILD_CREATE payload size.
+
+A synthetic guild with `members` members is built through discord.py's own state handling, once with and once
+without presence data for the online share of members, and the traced allocations are compared.
+Ongoing PRESENCE_UPDATE traffic depends on the guilds, so it is measured live instead: see the gateway
+breakdown in the `debug` command, which attributes events to the intent that causes them.
+
+Run `python -m utils.presence_benchmark [members] [online ratio]`, e.g. `python -m utils.presence_benchmark 10000 0.3`.
+"""
+import gc
+import json
+import sys
+import tracemalloc
+
+import discord
+from discord.guild import Guild
+from discord.state import ConnectionState
+
+JOINED_AT = '2020-11-01T12:00:00.000000+00:00'
+
+
+def guild_payload(members: int, online_ratio: float, presences: bool) -> dict:
+    member_data = []
+    presence_data = []
+    for index in range(members):
+        user_id = str(10 ** 17 + index)
+        member_data.append({
+            'user': {'id': user_id, 'username': f'member{index}', 'discriminator': f'{index % 10000:04d}',
+                     'avatar': 'a' * 32},
+            'roles': [],
+            'joined_at': JOINED_AT,
+            'deaf': False,
+            'mute': False
+        })
+        # Discord only sends presences for members that are not offline.
+        if presences and index < members * online_ratio:
+            presence_data.append({
+                'user': {'id': user_id},
+                'status': 'online',
+                'activities': [{'name': f'Game {index % 50}', 'type': 0, 'created_at': 1600000000000}],
+                'client_status': {'desktop': 'online'}
+            })
+    return {
+        'id': '1', 'name': 'Benchmark', 'member_count': members, 'large': True,
+        'roles': [], 'emojis': [], 'channels': [],
+        'members': member_data, 'presences': presence_data
+    }
+
+
+def measure(members: int, online_ratio: float, presences: bool) -> dict:
+    """
+    :return: Dict with the traced bytes held by the member cache and the GUILD_CREATE payload size in bytes.
+    """
+    intents = discord.Intents(guilds=True, members=True, presences=presences)
+    state = ConnectionState(dispatch=lambda *args: None, handlers={}, hooks={}, syncer=None, http=None,
+                            loop=None, intents=intents)
+    payload = guild_payload(members, online_ratio, presences)
+    payload_bytes = len(json.dumps(payload, separators=(',', ':')))
+
+    gc.collect()
+    tracemalloc.start()
+    guild = Guild(data=payload, state=state)
+    gc.collect()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(guild.members) == members
+    return {'memory_bytes': held, 'payload_bytes': payload_bytes}
+
+
+def benchmark(members: int = 10000, online_ratio: float = 0.3) -> dict:
+    return {
+        'presences': measure(members, online_ratio, presences=True),
+        'lean': measure(members, online_ratio, presences=False)
+    }
+
+
+if __name__ == '__main__':
+    member_count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    ratio = float(sys.argv[2]) if len(sys.argv) > 2 else 0.3
+    results = benchmark(member_count, ratio)
+    print(f'{member_count} members, {ratio:.0%} online')
+    print(f'{"mode":<10} {"cache MB":>10} {"bytes/member":>13} {"GUILD_CREATE KB":>16}')
+    for mode, result in results.items():
+        print(f'{mode:<10} {result["memory_bytes"] / 1000000:>10.2f} {result["memory_bytes"] / member_count:>13.0f} '
+              f'{result["payload_bytes"] / 1000:>16.0f}')
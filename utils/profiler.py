@@ -0,0 +1,123 @@
+import cProfile
+import collections
+import os
+import pstats
+import sys
+import threading
+import time
+
+from utils.functions import ROOT
+
+
+# Relative paths of FrogBot's own code, as they appear in profiler labels.
+PROJECT_PREFIXES = ('cogs' + os.sep, 'utils' + os.sep, 'dbot.py')
+
+
+def is_project_file(filename: str) -> bool:
+    return filename.startswith(ROOT)
+
+
+def _label(filename: str, lineno: int, name: str) -> str:
+    if is_project_file(filename):
+        filename = os.path.relpath(filename, ROOT)
+    else:
+        filename = os.path.basename(filename)
+    return f'{filename}:{lineno}({name})'
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread (the event loop's) from a background thread every `interval` seconds.
+
+    Stacks are collected in collapsed form (`outer;inner;leaf`), ready for flamegraph tools.
+    """
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self.samples = 0
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(_label(code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def dump(self, path: str):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+    def top(self, limit: int = 15, project_only: bool = False) -> list:
+        """
+        :return: List of (function, cumulative %, self %) sorted by cumulative samples.
+        """
+        cumulative = collections.Counter()
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            for function in set(frames):
+                cumulative[function] += count
+        rows = []
+        if not self.samples:
+            return rows
+        for function, count in cumulative.most_common():
+            if project_only and not function.startswith(PROJECT_PREFIXES):
+                continue
+            rows.append((function, 100 * count / self.samples, 100 * own[function] / self.samples))
+            if len(rows) >= limit:
+                break
+        return rows
+
+
+class CProfileSession:
+    """
+    Deterministic profiling with cProfile. Only code running on the thread that called `start` is profiled.
+    """
+
+    def __init__(self):
+        self.profile = cProfile.Profile()
+        self.started = None
+
+    def start(self):
+        self.started = time.monotonic()
+        self.profile.enable()
+
+    def stop(self):
+        self.profile.disable()
+
+    def dump(self, path: str):
+        self.profile.dump_stats(path)
+
+    def top(self, limit: int = 15, project_only: bool = False) -> list:
+        """
+        :return: List of (function, cumulative seconds, own seconds) sorted by cumulative time.
+        """
+        stats = pstats.Stats(self.profile).stats
+        rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        out = []
+        for (filename, lineno, name), (_, _, own_time, cumulative_time, _) in rows:
+            if project_only and not is_project_file(filename):
+                continue
+            out.append((_label(filename, lineno, name), cumulative_time, own_time))
+            if len(out) >= limit:
+                break
+        return out
@@ -0,0 +1,102 @@
+import collections
+import logging
+import time
+
+from discord.ext import commands
+
+log = logging.getLogger(__name__)
+
+Policy = collections.namedtuple('Policy', ['rate', 'per', 'type'])
+
+
+def parse_policies(raw: str) -> dict:
+    """
+    Parses policies in the form `name=rate/per,name=rate/per`, e.g. `images=1/30,dm=1/3`.
+    """
+    policies = {}
+    for item in filter(None, (part.strip() for part in raw.split(','))):
+        name, _, limit = item.partition('=')
+        rate, _, per = limit.partition('/')
+        policies[name.strip()] = Policy(int(rate), float(per), commands.BucketType.user)
+    return policies
+
+
+class Bucket:
+    __slots__ = ('tokens', 'window')
+
+    def __init__(self, tokens: int, window: float = 0.0):
+        self.tokens = tokens
+        self.window = window
+
+
+class RateLimiter:
+    """
+    Per-user rate limits shared by every cog, one policy per command (or group of commands).
+
+    Buckets are kept in an LRU capped at `max_buckets`, and use wall-clock time so they can be snapshotted
+    to the database and restored after a restart.
+    """
+
+    def __init__(self, policies: dict, max_buckets: int = 10000):
+        self.policies = policies
+        self.max_buckets = max_buckets
+        self._buckets = collections.OrderedDict()
+        self.evicted = 0
+
+    def update(self, policy_name: str, key: int) -> float:
+        """
+        Uses one token from the bucket for `key` under the named policy.
+
+        :return: Seconds until the bucket refills if it is empty, otherwise 0.
+        """
+        policy = self.policies[policy_name]
+        bucket_key = (policy_name, key)
+        now = time.time()
+
+        bucket = self._buckets.get(bucket_key)
+        if bucket is None:
+            bucket = self._buckets[bucket_key] = Bucket(policy.rate)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+                self.evicted += 1
+        else:
+            self._buckets.move_to_end(bucket_key)
+
+        if now > bucket.window + policy.per:
+            bucket.tokens = policy.rate
+        if bucket.tokens == policy.rate:
+            bucket.window = now
+        if bucket.tokens == 0:
+            return policy.per - (now - bucket.window)
+        bucket.tokens -= 1
+        return 0
+
+    def counts(self) -> collections.Counter:
+        return collections.Counter(policy_name for policy_name, _ in self._buckets)
+
+    # ---- Persistence ----
+    async def save(self, db):
+        """
+        Replaces the snapshot in `db` with every bucket that is still limiting someone.
+        """
+        now = time.time()
+        docs = []
+        for (policy_name, key), bucket in self._buckets.items():
+            policy = self.policies.get(policy_name)
+            if policy is None or bucket.tokens >= policy.rate or now > bucket.window + policy.per:
+                continue
+            docs.append({'policy': policy_name, 'key': key, 'tokens': bucket.tokens, 'window': bucket.window})
+        await db.delete_many({})
+        if docs:
+            await db.insert_many(docs)
+
+    async def load(self, db):
+        now = time.time()
+        loaded = 0
+        async for doc in db.find():
+            policy = self.policies.get(doc['policy'])
+            if policy is None or now > doc['window'] + policy.per:
+                continue
+            self._buckets[(doc['policy'], doc['key'])] = Bucket(doc['tokens'], doc['window'])
+            loaded += 1
+        log.info(f'Restored {loaded} rate limit bucket{"s" if loaded != 1 else ""}.')
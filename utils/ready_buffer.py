@@ -0,0 +1,50 @@
+import collections
+import datetime
+
+
+class ReadyBuffer:
+    """
+    Holds messages received before the bot is ready, so they can be dispatched once it is.
+
+    At most `size` messages are kept; when full, the oldest is dropped. Messages older than `max_age` seconds
+    when the buffer is drained are dropped as stale, since a late reply to them would only confuse.
+    """
+
+    def __init__(self, size: int = 200, max_age: float = 60):
+        self.max_age = max_age
+        self.messages = collections.deque(maxlen=size)
+        self.buffered = 0
+        self.replayed = 0
+        self.dropped_overflow = 0
+        self.dropped_stale = 0
+
+    def add(self, message):
+        if self.messages.maxlen == 0:
+            self.dropped_overflow += 1
+            return
+        if len(self.messages) == self.messages.maxlen:
+            self.dropped_overflow += 1
+        self.messages.append(message)
+        self.buffered += 1
+
+    def drain(self):
+        """
+        Yields the buffered messages that are not stale, oldest first, and empties the buffer.
+        """
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.max_age)
+        while self.messages:
+            message = self.messages.popleft()
+            if message.created_at < cutoff:
+                self.dropped_stale += 1
+                continue
+            self.replayed += 1
+            yield message
+
+    def stats(self) -> dict:
+        return {
+            'pending': len(self.messages),
+            'buffered': self.buffered,
+            'replayed': self.replayed,
+            'dropped_overflow': self.dropped_overflow,
+            'dropped_stale': self.dropped_stale
+        }
@@ -0,0 +1,67 @@
+import asyncio
+import collections
+import os
+import time
+
+import psutil
+
+Sample = collections.namedtuple('Sample', ['when', 'rss', 'uss', 'cpu', 'fds', 'tasks', 'loop_lag', 'mem_total'])
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+
+
+def sparkline(values) -> str:
+    values = list(values)
+    if not values:
+        return ''
+    low, high = min(values), max(values)
+    spread = (high - low) or 1
+    return ''.join(SPARK_CHARS[int((v - low) / spread * (len(SPARK_CHARS) - 1))] for v in values)
+
+
+class SystemSampler:
+    """
+    Samples process metrics into a fixed-size ring buffer.
+
+    The psutil calls (which read `/proc` synchronously) run in the default executor, never on the event loop.
+    """
+
+    def __init__(self, loop, history: int = 120):
+        self.loop = loop
+        self.samples = collections.deque(maxlen=history)
+        self._proc = psutil.Process(os.getpid())
+        # The first cpu_percent call always returns 0, so prime it now.
+        self._proc.cpu_percent(None)
+
+    def _read(self):
+        with self._proc.oneshot():
+            memory = self._proc.memory_full_info()
+            cpu = self._proc.cpu_percent(None)
+            try:
+                fds = self._proc.num_fds()
+            except AttributeError:  # Windows
+                fds = self._proc.num_handles()
+        return memory.rss, memory.uss, cpu, fds, psutil.virtual_memory().total
+
+    async def sample(self, loop_lag: float = 0.0) -> Sample:
+        rss, uss, cpu, fds, mem_total = await self.loop.run_in_executor(None, self._read)
+        sample = Sample(time.time(), rss, uss, cpu, fds, len(asyncio.all_tasks(self.loop)), loop_lag, mem_total)
+        self.samples.append(sample)
+        return sample
+
+    @property
+    def latest(self):
+        return self.samples[-1] if self.samples else None
+
+    def series(self, field: str) -> list:
+        return [getattr(sample, field) for sample in self.samples]
+
+    def describe(self, field: str, scale: float = 1, width: int = 20) -> str:
+        """
+        Renders the current, min and max values of a field, and a sparkline of its recent trend.
+        """
+        values = [v / scale for v in self.series(field)]
+        if not values:
+            return 'No samples yet.'
+        step = max(1, len(values) // width)
+        return f'{values[-1]:.1f} (min {min(values):.1f}, max {max(values):.1f})\n{sparkline(values[::-step][::-1])}'
@@ -0,0 +1,131 @@
+"""
+Sentry performance tracing for commands.
+
+Each command runs inside its own transaction, kept in a context variable so spans (checks, Mongo commands,
+Discord REST calls) attach to the right command even when several run concurrently. Motor copies the context
+into its worker threads, so the Mongo command listener can find the transaction too.
+"""
+import contextlib
+import contextvars
+import time
+
+import sentry_sdk
+
+from utils.functions import ROOT
+
+current_transaction = contextvars.ContextVar('current_transaction', default=None)
+
+# Set once Sentry is initialised, so tracing costs nothing when it is not.
+enabled = False
+
+
+def parse_rates(raw: str) -> dict:
+    """
+    Parses sample rates in the form `name=rate,name=rate`, e.g. `default=0.05,sheet=1`.
+    """
+    rates = {}
+    for item in filter(None, (part.strip() for part in raw.split(','))):
+        name, _, rate = item.partition('=')
+        rates[name.strip()] = float(rate)
+    return rates
+
+
+def make_sampler(rates: dict):
+    """
+    Returns a Sentry `traces_sampler` that samples command transactions by command name.
+
+    The full command name is tried first (`sheet queue`), then its root command (`sheet`), then `default`.
+    """
+    default = rates.get('default', 0.0)
+
+    def traces_sampler(sampling_context):
+        context = sampling_context.get('transaction_context') or {}
+        if context.get('op') != 'command':
+            return default
+        name = context.get('name') or ''
+        if name in rates:
+            return rates[name]
+        return rates.get(name.split(' ')[0], default)
+
+    return traces_sampler
+
+
+@contextlib.contextmanager
+def command_transaction(ctx):
+    transaction = sentry_sdk.start_transaction(op='command', name=ctx.command.qualified_name)
+    transaction.set_tag('guild.id', getattr(ctx.guild, 'id', None))
+    token = current_transaction.set(transaction)
+    try:
+        yield transaction
+    finally:
+        current_transaction.reset(token)
+        transaction.set_status('internal_error' if ctx.command_failed else 'ok')
+        transaction.finish()
+
+
+def start_span(op: str, description: str):
+    """
+    Starts a child span of the current command's transaction, or returns None if it is not being sampled.
+    The caller must call `finish()` on the span.
+    """
+    transaction = current_transaction.get()
+    if transaction is None or not transaction.sampled:
+        return None
+    return transaction.start_child(op=op, description=description)
+
+
+@contextlib.contextmanager
+def span(op: str, description: str):
+    child = start_span(op, description)
+    if child is None:
+        yield None
+        return
+    try:
+        yield child
+    finally:
+        child.finish()
+
+
+class ErrorThrottle:
+    """
+    Decides whether an error should be sent to Sentry, allowing `limit` of the same error every `window` seconds.
+
+    Errors are considered the same if they have the same type, came from the same command, and passed through
+    the same line of FrogBot's own code last. Library lines are skipped, since unrelated bugs often fail inside
+    the same library call.
+    """
+
+    def __init__(self, limit: int = 5, window: float = 3600, max_tracked: int = 1000):
+        self.limit = limit
+        self.window = window
+        self.max_tracked = max_tracked
+        self._seen = {}
+        self.suppressed = 0
+
+    @staticmethod
+    def fingerprint(error, command: str = None) -> tuple:
+        # Command errors wrap the exception that was actually raised.
+        error = getattr(error, 'original', error)
+        location = (None, None)
+        tb = error.__traceback__
+        while tb is not None:
+            filename = tb.tb_frame.f_code.co_filename
+            if filename.startswith(ROOT):
+                location = (filename, tb.tb_lineno)
+            tb = tb.tb_next
+        return (type(error).__name__, command) + location
+
+    def allow(self, error, command: str = None) -> bool:
+        now = time.monotonic()
+        key = self.fingerprint(error, command)
+        started, count = self._seen.get(key, (now, 0))
+        if now - started > self.window:
+            started, count = now, 0
+        if count >= self.limit:
+            self.suppressed += 1
+            self._seen[key] = (started, count + 1)
+            return False
+        if key not in self._seen and len(self._seen) >= self.max_tracked:
+            self._seen.clear()
+        self._seen[key] = (started, count + 1)
+        return True